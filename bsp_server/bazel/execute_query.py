@@ -1,6 +1,6 @@
 import json
 import tempfile
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 from tqdm import tqdm
 
@@ -12,11 +12,15 @@ TAGS = "tags"
 TARGET_PROTO_ATTRIBUTES_ALLOW_LIST = {SRCS, TAGS}
 EXTERNAL_REPO_PREFIX = "@"
 
+# Throttle progress bar refreshes, queries can stream tens of thousands of records
+PROGRESS_MIN_INTERVAL_SEC = 1.0
+PROGRESS_MIN_ITERS = 1000
+
 
 def execute_query(
     cwd: str,
     targets: list[str],
-    query_kinds: Optional[list[str]] = None,
+    query_kinds: Union[str, list[str], None] = None,
     query_deps: bool = False,
     query_rdeps: bool = False,
     query_rdeps_universe: Optional[str] = None,
@@ -25,16 +29,19 @@ def execute_query(
     stderr=None,
     env_vars=None,
     soft_fail=False,
-) -> list[dict]:
+) -> Iterator[dict]:
     """
     Execute a bazel query to gather information from each of the targets in the
     'targets parameter'. We deserialize the results into json objects for further
     processing. Only targets of type "RULE" is included. Also, target names with
     external repo prefix is excluded.
 
+    Results are yielded as they are streamed from bazel so callers can consume
+    them incrementally instead of holding the whole query output in memory.
+
     :param cwd: the current working directory to execute the query
     :param targets: the targets to query information about
-    :param query_kinds: rules names to query
+    :param query_kinds: rules names to query, or a precomputed kind pattern
     :param query_deps: whether to query deps of those targets or not. It will
     end up querying `external` targets and can be very slow to run. If you don't
     need external targets query targets using //... and manually filter out
@@ -48,7 +55,7 @@ def execute_query(
     executing the query
     :param query_filter: An optional filter expression passed to Bazel query.
     :param soft_fail: Ignore query errors
-    :return: a QueryResult containing the results of the query.
+    :return: an iterator over the deserialized query results.
     """
     query_file = _create_query_file(
         targets=targets,
@@ -72,9 +79,9 @@ def execute_query(
     if soft_fail:
         cmd.append("--keep_going")
 
-    outputs = []
     query_return_code = 0
     query_error_string = None
+    skipped_lines = 0
     try:
         for return_code, error_string, line in tqdm(
             utils.stream_output(
@@ -82,32 +89,41 @@ def execute_query(
                 cwd=cwd,
                 stderr=stderr,
                 env_vars=env_vars,
+                text=False,
             ),
             desc="Running bazel query (approx 45s)",
             unit=" targets",
+            mininterval=PROGRESS_MIN_INTERVAL_SEC,
+            miniters=PROGRESS_MIN_ITERS,
         ):
-            query_return_code = return_code
-            query_error_string = error_string
+            if return_code != 0:
+                query_return_code = return_code
+                query_error_string = error_string
+                continue
             try:
-                outputs.append(json.loads(line))
-            finally:
+                # json decodes the raw bytes itself
+                result = json.loads(line)
+            except ValueError:
+                skipped_lines += 1
                 continue
+            yield result
 
     finally:
         utils.safe_delete(query_file)
 
+    if skipped_lines:
+        print(f"Skipped {skipped_lines} malformed bazel query output lines")
+
     if not soft_fail and query_return_code != 0:
         raise RuntimeError(
             f"Bazel query failed with return code: "
             f"{query_return_code} and error: {query_error_string}",
         )
 
-    return outputs
-
 
 def _create_query_file(
     targets: list[str],
-    query_kinds: Optional[list[str]] = None,
+    query_kinds: Union[str, list[str], None] = None,
     query_deps: bool = False,
     query_rdeps: bool = False,
     query_tags: Optional[list[str]] = None,
@@ -123,7 +139,7 @@ def _create_query_file(
     a query file instead.
 
     :param targets: The targets we want to include in the query
-    :param query_kinds: kind of rules to keep
+    :param query_kinds: kind of rules to keep, or a precomputed kind pattern
     :param query_deps: whether to get deps
     :param query_rdeps: whether to get rdeps
     :param query_tags: tags to filter the targets.
@@ -132,26 +148,24 @@ def _create_query_file(
     :param query_filter: An optional filter expression passed to Bazel query
     :return: the name of the query file
     """
-    query_file = tempfile.NamedTemporaryFile(delete=False).name
-    utils.write_string_content(
-        _query_string(
-            targets=targets,
-            query_kinds=query_kinds,
-            query_deps=query_deps,
-            query_rdeps=query_rdeps,
-            query_tags=query_tags,
-            query_depth=query_depth,
-            query_rdeps_universe=query_rdeps_universe,
-            query_filter=query_filter,
-        ),
-        query_file,
+    query_string = _query_string(
+        targets=targets,
+        query_kinds=query_kinds,
+        query_deps=query_deps,
+        query_rdeps=query_rdeps,
+        query_tags=query_tags,
+        query_depth=query_depth,
+        query_rdeps_universe=query_rdeps_universe,
+        query_filter=query_filter,
     )
-    return query_file
+    with tempfile.NamedTemporaryFile(mode="w", delete=False) as query_file:
+        query_file.write(query_string)
+    return query_file.name
 
 
 def _query_string(
     targets: list[str],
-    query_kinds: Optional[list[str]] = None,
+    query_kinds: Union[str, list[str], None] = None,
     query_deps: bool = False,
     query_rdeps: bool = False,
     query_depth: Optional[int] = None,
@@ -174,7 +188,7 @@ def _query_string(
 
     :param targets: A list of targets to query
     :param query_tags: tags to filter the targets.
-    :param query_kinds: kind of rules to keep
+    :param query_kinds: kind of rules to keep, or a precomputed kind pattern
     :param query_deps: whether to get deps
     :param query_rdeps: whether to get rdeps
     :param query_rdeps_universe: universe for rdeps
@@ -188,30 +202,38 @@ def _query_string(
     if query_deps and query_rdeps:
         raise RuntimeError("query_deps and query_rdeps cannot be used together.")
 
-    query_string = " + ".join([f'"{target}"' for target in targets])
+    # Collect the wrapping functions from the innermost to the outermost and join
+    # everything once instead of copying the growing query for every wrap
+    prefixes = []
+    suffixes = []
 
     if query_deps or query_rdeps:
         if query_rdeps:
-            query_fun = "rdeps"
             universe = query_rdeps_universe if query_rdeps_universe else "//..."
-            query_string = f'"{universe}", {query_string}'
+            prefixes.append(f'rdeps("{universe}", ')
         else:
-            query_fun = "deps"
+            prefixes.append("deps(")
 
         if query_depth is None:
-            query_string = f"{query_fun}({query_string})"
+            suffixes.append(")")
         else:
-            query_string = f"{query_fun}({query_string}, {query_depth})"
+            suffixes.append(f", {query_depth})")
 
     if query_tags:
         pattern = "|".join([f"\\b{tag}\\b" for tag in query_tags])
-        query_string = f'attr(tags, "{pattern}", {query_string})'
+        prefixes.append(f'attr(tags, "{pattern}", ')
+        suffixes.append(")")
 
     if query_kinds:
-        query_string = f'kind("{"|".join(query_kinds)}", {query_string})'
+        if not isinstance(query_kinds, str):
+            query_kinds = "|".join(query_kinds)
+        prefixes.append(f'kind("{query_kinds}", ')
+        suffixes.append(")")
 
     # Apply bazel query filter functionality if query_filter is provided
     if query_filter:
-        query_string = f'filter(".*{query_filter}.*", {query_string})'
+        prefixes.append(f'filter(".*{query_filter}.*", ')
+        suffixes.append(")")
 
-    return query_string
+    targets_union = " + ".join([f'"{target}"' for target in targets])
+    return "".join([*reversed(prefixes), targets_union, *suffixes])
@@ -5,7 +5,7 @@ import tempfile
 import unittest
 from unittest.mock import ANY, patch
 
-from bsp_server.bazel.execute_query import execute_query
+from bsp_server.bazel.execute_query import _query_string, execute_query
 from bsp_server.util import utils
 
 
@@ -100,7 +100,64 @@ class ExecuteQueryTest(unittest.TestCase):
         # When
         actual = execute_query(cwd=self.temp_dir, targets=targets)
 
-        self.assertEqual(query_result, actual)
+        self.assertEqual(query_result, list(actual))
+
+    @patch("bsp_server.util.utils.stream_output")
+    def test_execute_query_skips_malformed_lines(self, m_stream_output):
+        query_result = {"type": "RULE", "rule": {"name": "rule_name1"}}
+        m_stream_output.return_value = iter(
+            [
+                (0, None, json.dumps(query_result)),
+                (0, None, b"not json"),
+                (0, None, b"\xff"),
+                (0, None, b""),
+            ]
+        )
+
+        actual = execute_query(cwd=self.temp_dir, targets=["//my/test:target"])
+
+        self.assertEqual([query_result], list(actual))
+
+    @patch("bsp_server.util.utils.stream_output")
+    def test_execute_query_failure(self, m_stream_output):
+        m_stream_output.return_value = iter([(1, "query error", None)])
+
+        with self.assertRaises(RuntimeError):
+            list(execute_query(cwd=self.temp_dir, targets=["//my/test:target"]))
+
+        m_stream_output.return_value = iter([(1, "query error", None)])
+        actual = execute_query(
+            cwd=self.temp_dir, targets=["//my/test:target"], soft_fail=True
+        )
+        self.assertEqual([], list(actual))
+
+    def test_query_string(self):
+        targets = ["//my/test:target", "//my/other/..."]
+        union = '"//my/test:target" + "//my/other/..."'
+
+        self.assertEqual(_query_string(targets=targets), union)
+        self.assertEqual(
+            _query_string(targets=targets, query_deps=True, query_depth=2),
+            f"deps({union}, 2)",
+        )
+        self.assertEqual(
+            _query_string(
+                targets=targets,
+                query_rdeps=True,
+                query_kinds=["java_library", "java_test"],
+                query_filter="src",
+            ),
+            f'filter(".*src.*", kind("java_library|java_test", '
+            f'rdeps("//...", {union})))',
+        )
+        self.assertEqual(
+            _query_string(targets=targets, query_kinds="java_import|java_library"),
+            f'kind("java_import|java_library", {union})',
+        )
+        self.assertEqual(
+            _query_string(targets=targets, query_tags=["manual"]),
+            f'attr(tags, "\\bmanual\\b", {union})',
+        )
 
 
 if __name__ == "__main__":
@@ -16,7 +16,9 @@ SCIP_TOOLING_TARGET = "@scip_lsp//src/main/java/com/uber/scip/aggregator:aggrega
 
 JDK_SCIP_FILE_PREFIX = "jdk_temurin"
 SHA256_FILE_SUFFIX = ".sha256"
+SCIP_INDEX_DIR = ".scip"
 WORKSPACE_FILE_NAME = "workspace.json"
+CACHE_DIR = "cache"
 
 JAVA_VERSION_FLAGS = [
     "--java_language_version=17",
@@ -35,7 +37,8 @@ SCIP_TARGET_SUFFIX = "_scip_index"
 
 # Note we mention native rules instead of uber macros
 # this allows us to execute kind query on bazel
-SUPPORTED_RULES = ["java_library", "java_import", "java_test", "jvm_import"]
+SUPPORTED_RULES = frozenset({"java_library", "java_import", "java_test", "jvm_import"})
+SUPPORTED_RULES_KIND_PATTERN = "|".join(sorted(SUPPORTED_RULES))
 
 # bazelproject section names
 TARGETS = "targets"
@@ -1,10 +1,12 @@
 import argparse
+import hashlib
+import json
 import os
 import tempfile
+import time
 from dataclasses import asdict, dataclass
-from datetime import datetime
 from pprint import pprint
-from typing import Tuple
+from typing import Iterable, Tuple, Union
 
 from bsp_server.bazel.execute_query import execute_query
 from bsp_server.scip_sync_util import incremental, scip_utils
@@ -15,17 +17,25 @@ from bsp_server.scip_sync_util.scip_const import (
     ASPECT_SCIP_INDEX,
     BAZEL,
     BUILD,
+    CACHE_DIR,
     DERIVE_TARGETS_FROM_DIRECTORIES,
     DIRECTORIES,
     JAVA_VERSION_FLAGS,
+    SCIP_INDEX_DIR,
     SCIP_TOOLING_TARGET,
-    SUPPORTED_RULES,
+    SUPPORTED_RULES_KIND_PATTERN,
     TARGETS,
 )
 from bsp_server.util import utils
 
 enable_scip_env = {"ENABLE_SCIP_INDEX_GEN": "true"}
-SCIP_INDEX_DIR = ".scip"
+# Files whose changes invalidate the cached dependency graph
+DEPENDENCY_GRAPH_CACHE_INPUTS = [
+    os.path.join(".ijwb", ".bazelproject"),
+    "MODULE.bazel",
+    "WORKSPACE",
+    "WORKSPACE.bazel",
+]
 
 
 @dataclass
@@ -69,9 +79,17 @@ def main():
         help="Dependency graph depth for the index generation",
     )
 
+    parser.add_argument(
+        "--use_cache",
+        action="store_true",
+        help="reuse the dependency graph of a previous sync with the same targets, "
+        "the cache is keyed on .bazelproject, MODULE.bazel and WORKSPACE only, "
+        "so changes to BUILD files are not detected",
+    )
+
     sync_stats = SyncStats()
 
-    index_start = datetime.now()
+    index_start = time.monotonic()
 
     args = parser.parse_args()
     targets = args.targets
@@ -111,7 +129,7 @@ def main():
 
         # File not in workspace or error occurred, add its target to the list
         file_target = scip_utils.get_containing_bazel_target(
-            cwd, filepath, SUPPORTED_RULES
+            cwd, filepath, SUPPORTED_RULES_KIND_PATTERN
         )
         if file_target:
             targets.append(file_target)
@@ -125,9 +143,22 @@ def main():
 
     # Get all deps
     print(f"Syncing deps for targets: {list(targets)}")
-    buildable_scip_targets = get_dependency_graph(
-        cwd=cwd, targets=targets, depth=args.depth, exclude_targets=excludes
-    )
+    buildable_scip_targets = None
+    cache_path = None
+    if args.use_cache:
+        cache_path = get_dependency_graph_cache_path(cwd, targets, excludes, args.depth)
+        buildable_scip_targets = read_dependency_graph_cache(cache_path)
+
+    if buildable_scip_targets is None:
+        buildable_scip_targets = get_dependency_graph(
+            cwd=cwd, targets=targets, depth=args.depth, exclude_targets=excludes
+        )
+        if cache_path:
+            utils.write_json(
+                buildable_scip_targets,
+                cache_path,
+                default_serializer=utils.set_to_list,
+            )
 
     if len(buildable_scip_targets) == 0:
         print("Found no targets to sync ...")
@@ -136,9 +167,7 @@ def main():
     # Update stats
     sync_stats.total_scip_targets_identified = len(buildable_scip_targets)
     sync_stats.total_will_build_scip_target = len(buildable_scip_targets)
-    sync_stats.index_target_extraction_time_sec = (
-        datetime.now() - index_start
-    ).total_seconds()
+    sync_stats.index_target_extraction_time_sec = time.monotonic() - index_start
 
     # Generate SCIP indexes
     sync_scip(cwd, buildable_scip_targets, sync_stats)
@@ -150,44 +179,51 @@ def main():
         buildable_scip_targets,
     )
 
-    # Collect indexes and update workspace
-    index_target_map = {}
-    for target, target_mnemonics in target_to_output.items():
-        # Collect indexes
-        index_list = target_mnemonics.get(ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value, [])
-        for index in index_list:
-            if os.path.exists(os.path.join(cwd, index)):
-                index_target_map.setdefault(target, []).append(os.path.join(cwd, index))
-
     workspace = scip_workspace.populate_workspace(cwd, target_to_output)
     scip_workspace.write_workspace(workspace, os.path.join(cwd, SCIP_INDEX_DIR))
 
-    # Calculate stats and copy indexes
-    relevant_index = list(
-        set(index_target_map.keys()).intersection(set(buildable_scip_targets))
+    # Collect the indexes of the requested targets that were actually built
+    target_index_paths = {
+        target: [
+            os.path.join(cwd, index)
+            for index in target_mnemonics.get(
+                ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value, []
+            )
+        ]
+        for target, target_mnemonics in target_to_output.items()
+        if target in buildable_scip_targets
+    }
+    existing_index_paths = scip_utils.filter_existing_paths(
+        path for paths in target_index_paths.values() for path in paths
     )
-    sync_stats.passed_index_cnt = len(relevant_index)
+    index_to_copy = set()
+    passed_index_cnt = 0
+    for index_paths in target_index_paths.values():
+        built_paths = [path for path in index_paths if path in existing_index_paths]
+        if built_paths:
+            index_to_copy.update(built_paths)
+            passed_index_cnt += 1
+
+    # Calculate stats
+    sync_stats.passed_index_cnt = passed_index_cnt
     sync_stats.failed_index_cnt = (
         sync_stats.total_will_build_scip_target - sync_stats.passed_index_cnt
     )
 
     # Copy indexes to SCIP directory
-    index_to_copy = set()
-    for idx in relevant_index:
-        index_to_copy.update(index_target_map[idx])
-
-    start_copy_index = datetime.now()
+    start_copy_index = time.monotonic()
     scip_utils.copy_index(index_to_copy, os.path.join(cwd, SCIP_INDEX_DIR))
-    sync_stats.copy_index_time_sec = (datetime.now() - start_copy_index).total_seconds()
+    sync_stats.copy_index_time_sec = time.monotonic() - start_copy_index
 
     print(f"--- Sync Stats ---")
-    sync_stats.total_duration_sec = (datetime.now() - index_start).total_seconds()
+    sync_stats.total_duration_sec = time.monotonic() - index_start
     pprint(asdict(sync_stats), indent=2, sort_dicts=False)
 
 
 # Generate the scip index
 def sync_scip(cwd: str, targets: set[str], stats: SyncStats) -> None:
-    start = datetime.now()
+    start = time.monotonic()
+    targets_file_path = None
     try:
         # Build tooling needed for the incremental flow
         cmd = [
@@ -197,12 +233,13 @@ def sync_scip(cwd: str, targets: set[str], stats: SyncStats) -> None:
             "--keep_going",
         ] + JAVA_VERSION_FLAGS
         utils.output(cmd, cwd=cwd)
-        targets_file = tempfile.NamedTemporaryFile(delete=False).name
-        utils.write_list(targets, targets_file)
+        with tempfile.NamedTemporaryFile(mode="w", delete=False) as targets_file:
+            targets_file.write("\n".join(targets) + "\n")
+            targets_file_path = targets_file.name
         cmd = [
             BAZEL,
             BUILD,
-            "--target_pattern_file=" + targets_file,
+            "--target_pattern_file=" + targets_file_path,
             "--keep_going",
             "--aspects",
             ASPECT_SCIP_INDEX,
@@ -214,8 +251,9 @@ def sync_scip(cwd: str, targets: set[str], stats: SyncStats) -> None:
         # since we have many failing scip targets no need to panic
         pass
     finally:
-        end = datetime.now()
-        sync_time = (end - start).total_seconds()
+        if targets_file_path:
+            utils.safe_delete(targets_file_path)
+        sync_time = time.monotonic() - start
         stats.index_sync_time_sec = sync_time
         print(f"--- Completed sync in {sync_time:.2f}s ---")
 
@@ -225,16 +263,17 @@ def get_dependency_graph(
     targets: set[str],
     depth: int,
     exclude_targets=None,
-    query_kinds: list = SUPPORTED_RULES,
+    query_kinds: Union[str, list[str]] = SUPPORTED_RULES_KIND_PATTERN,
     query_rdeps: bool = False,
     query_deps: bool = True,
     query_rdeps_universe="//...",
 ) -> set[str]:
     if exclude_targets is None:
         exclude_targets = set()
+    targets = normalize_targets(targets)
     query_result = execute_query(
         cwd=cwd,
-        targets=list(targets),
+        targets=targets,
         query_kinds=query_kinds,
         query_deps=query_deps,
         query_rdeps=query_rdeps,
@@ -259,30 +298,101 @@ def get_dependency_graph(
         else:
             exclude_masks.add("^" + exclude + "$")
 
+    mask_pattern = scip_utils.compile_regex_set(masks)
+    exclude_pattern = scip_utils.compile_regex_set(exclude_masks)
+
     result = set()
 
     # in case of the rdeps we need to check dep, not target, target is the wanted result
     if query_rdeps:
-        for key in dep_graph.keys():
-            if scip_utils.filter_list_by_regex(
-                set(dep_graph[key]["direct_deps"]), masks
-            ) and not scip_utils.filter_list_by_regex(
-                set(dep_graph[key]["direct_deps"]), exclude_masks
+        # match every distinct dep once instead of once per dependant
+        all_deps = {dep for info in dep_graph.values() for dep in info["direct_deps"]}
+        matched_deps = scip_utils.filter_list_by_regex(all_deps, mask_pattern)
+        excluded_deps = scip_utils.filter_list_by_regex(all_deps, exclude_pattern)
+        for key, info in dep_graph.items():
+            direct_deps = info["direct_deps"]
+            if not matched_deps.isdisjoint(direct_deps) and excluded_deps.isdisjoint(
+                direct_deps
             ):
                 result.add(key)
     else:
         sanitized_targets.update(
-            scip_utils.filter_list_by_regex(set(dep_graph.keys()), masks)
+            scip_utils.filter_list_by_regex(set(dep_graph.keys()), mask_pattern)
+        )
+        # walk the dep_graph to get all the targets with limit depth, ignore depth if target is exported
+        result.update(
+            scip_utils.collect_dependencies(dep_graph, sanitized_targets, depth)
         )
-        for target in sanitized_targets:
-            # run DFS on the dep_graph to get all the targets with limit depth, ignore depth if target is exported
-            result.update(scip_utils.dfs(dep_graph, target, depth))
         result = result.difference(
-            scip_utils.filter_list_by_regex(result, exclude_masks)
+            scip_utils.filter_list_by_regex(result, exclude_pattern)
         )
     return result
 
 
+def normalize_targets(targets: Iterable[str]) -> list[str]:
+    """
+    Strip and deduplicate target patterns, and drop the ones already covered by
+    a recursive //path/... pattern in the same list.
+    """
+    targets = {target.strip() for target in targets if target.strip()}
+    recursive_roots = {
+        target[: -len("/...")] for target in targets if target.endswith("/...")
+    }
+
+    normalized = []
+    for target in sorted(targets):
+        if target.endswith("/..."):
+            # only a parent pattern can cover a recursive pattern
+            package = target[: -len("/...")].rpartition("/")[0]
+        else:
+            package = target.split(":")[0]
+
+        # walk up from the package, //a/b -> //a -> / (root of //...)
+        while package and package not in recursive_roots:
+            package = package.rpartition("/")[0]
+
+        if not package:
+            normalized.append(target)
+
+    return normalized
+
+
+def get_dependency_graph_cache_path(
+    cwd: str,
+    targets: set[str],
+    excludes: set[str],
+    depth: int,
+    query_kinds: Union[str, list[str]] = SUPPORTED_RULES_KIND_PATTERN,
+) -> str:
+    """
+    Cache file for the dependency graph of the given query. The key covers the
+    query arguments and the mtime of the workspace level files, changes to
+    BUILD files are not tracked.
+    """
+    if not isinstance(query_kinds, str):
+        query_kinds = sorted(query_kinds)
+    mtimes = {}
+    for cache_input in DEPENDENCY_GRAPH_CACHE_INPUTS:
+        try:
+            mtimes[cache_input] = os.stat(os.path.join(cwd, cache_input)).st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+    key = json.dumps(
+        [sorted(targets), sorted(excludes), depth, query_kinds, mtimes],
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(cwd, SCIP_INDEX_DIR, CACHE_DIR, f"depgraph-{digest}.json")
+
+
+def read_dependency_graph_cache(cache_path: str) -> Union[set[str], None]:
+    try:
+        return set(utils.get_json(cache_path))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
 def fetch_targets_from_bazelproject(cwd: str) -> Tuple[set[str], set[str]]:
     print("Reading targets from .bazelproject file...")
 
@@ -338,14 +448,12 @@ def _should_exclude_path(path: str) -> bool:
 
 
 def convert_directories_to_targets(directories: list[str]) -> list[str]:
-    targets = []
-    for directory in directories:
-        directory = directory.strip().rstrip("/")
-        # skip base directory
-        if "." == directory:
-            continue
-        targets.append(f"//{directory}/...")
-    return targets
+    # skip the base directory and blank entries
+    return [
+        f"//{directory}/..."
+        for entry in directories
+        if (directory := entry.strip().rstrip("/")) not in (".", "")
+    ]
 
 
 if __name__ == "__main__":
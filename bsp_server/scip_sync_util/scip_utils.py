@@ -5,13 +5,23 @@ import os
 import os.path
 import re
 import shutil
+import sys
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from typing import Iterable, Optional, Union
 
 from bsp_server.scip_sync_util import scip_const
 from bsp_server.util import utils
 
+# Longest query passed as a command line argument, Linux caps a single argument
+# at 128 KiB
+MAX_INLINE_QUERY_LENGTH = 100_000
+
+# Read size when an index is hashed while being copied
+COPY_CHUNK_SIZE = 1 << 20
+
 
 def parse_bazelproject(file_path: str) -> dict[str, list[str]]:
     """Parse a .bazelproject file and return a dictionary of the contents."""
@@ -25,76 +35,122 @@ def parse_bazelproject(file_path: str) -> dict[str, list[str]]:
             if not line or line.startswith("#"):
                 continue
 
-            key, value = _get_key_value(line)
+            # Target labels contain ":" but are values, not section headers
+            key, value = "", line
+            if not line.startswith("//"):
+                head, separator, tail = line.partition(":")
+                if separator:
+                    key, value = head.strip(), tail.strip()
 
-            if key != "":
+            if key:
                 data[key] = []
                 last_key = key
 
-            if value != "":
+            if value:
                 data[last_key].append(value)
 
     return data
 
 
-def _get_key_value(line: str) -> (str, str):
-    line = line.strip()
-    key = ""
-    value = line
-
-    if line.startswith("//"):
-        return key, value
-
-    if ":" in line:
-        k, _, v = line.partition(":")
-        key = k.strip()
-        value = v.strip()
-
-    return key, value
+def get_containing_bazel_target(
+    cwd: str, filepath: str, query_kinds: Union[str, list[str]]
+) -> str:
+    from_target = "//" + filepath.rpartition("/src")[0] + "/..."
+    if not isinstance(query_kinds, str):
+        query_kinds = _kind_pattern(tuple(query_kinds))
+    query_string = f'kind("{query_kinds}", rdeps("{from_target}", "{filepath}"))'
+    return utils.output([scip_const.BAZEL, scip_const.QUERY, query_string], cwd=cwd)
 
 
-def get_containing_bazel_target(cwd: str, filepath: str, query_kinds: list[str]) -> str:
-    from_target = "//" + filepath.rpartition("/src")[0] + "/..."
-    query_string = (
-        f'kind("{"|".join(query_kinds)}", rdeps("{from_target}", "{filepath}"))'
-    )
-    cmd = [
-        "bazel",
-        "query",
-        query_string,
-    ]
-    return utils.output(cmd, cwd=cwd)
+@lru_cache(maxsize=32)
+def _kind_pattern(query_kinds: tuple[str, ...]) -> str:
+    """Join rule kinds into a kind() pattern, keeping the first of repeated kinds."""
+    return "|".join(dict.fromkeys(query_kinds))
 
 
 def old_copy_index(index_to_copy: set[str], dest: str) -> None:
     utils.safe_create(dest, is_dir=True)
-    for index in index_to_copy:
+
+    def copy_with_sha256(index: str) -> None:
         parts = index.split(os.path.sep + "bin" + os.path.sep)
         idx = parts[-1]
         index_filename = idx.replace("/", "_").replace("-", "_")
 
         dest_path = os.path.join(dest, index_filename)
-        shutil.copy(index, dest_path)
 
-        sha_filename = index_filename + ".sha256"
+        # Reuse the digest bazel emitted next to the index when there is one,
+        # otherwise hash the index while copying it instead of reading it twice
+        sha256 = get_sha256_for_file(index + scip_const.SHA256_FILE_SUFFIX)
+        if sha256:
+            utils.copy_file(index, dest_path)
+        else:
+            sha256 = _copy_and_hash(index, dest_path)
+
+        sha_filename = index_filename + scip_const.SHA256_FILE_SUFFIX
         with open(os.path.join(dest, sha_filename), "w") as f:
-            f.write(generate_sha256(index) + "\n")
+            f.write(sha256 + "\n")
+
+    # Copying and hashing release the GIL, so indexes are handled concurrently
+    # on the shared I/O pool
+    list(get_io_executor().map(copy_with_sha256, index_to_copy))
 
 
 def generate_sha256(file_path: str) -> str:
-    sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256.update(byte_block)
+        return hashlib.file_digest(f, _new_sha256).hexdigest()
+
+
+def _copy_and_hash(src: str, dst: str) -> str:
+    """Copy src to dst and return the sha256 of the copied bytes."""
+    sha256 = _new_sha256()
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        while chunk := src_file.read(COPY_CHUNK_SIZE):
+            sha256.update(chunk)
+            dst_file.write(chunk)
     return sha256.hexdigest()
 
 
-def get_sha256_for_file(file_path: str) -> str:
+def _new_sha256():
+    # The digest is a change checksum, not a security boundary
+    return hashlib.sha256(usedforsecurity=False)
+
+
+def get_sha256_for_file(file_path: str) -> Optional[str]:
+    # The file holds the hex digest and a newline, the first token is the digest
     try:
-        with open(file_path, "r") as f:
-            return f.read().strip()
+        with open(file_path, "rb") as f:
+            sha = f.read().split(maxsplit=1)
     except FileNotFoundError:
         return None
+    return sha[0].decode("ascii") if sha else None
+
+
+def filter_existing_paths(paths: Iterable[str]) -> set[str]:
+    """
+    Return the paths which exist. Paths are grouped by directory so directories
+    holding several of them are listed once instead of stat-ing every path.
+    """
+    paths_by_dir = defaultdict(set)
+    for path in paths:
+        directory, name = os.path.split(path)
+        paths_by_dir[directory].add(name)
+
+    existing = set()
+    for directory, names in paths_by_dir.items():
+        if len(names) == 1:
+            path = os.path.join(directory, next(iter(names)))
+            if os.path.exists(path):
+                existing.add(path)
+            continue
+
+        try:
+            with os.scandir(directory or ".") as entries:
+                present = {entry.name for entry in entries}
+        except OSError:
+            continue
+        existing.update(os.path.join(directory, name) for name in names & present)
+
+    return existing
 
 
 def get_mnemonic_output(cwd, mnemonic, targets):
@@ -102,170 +158,115 @@ def get_mnemonic_output(cwd, mnemonic, targets):
     union = " + ".join(f'"{target}"' for target in targets)
     query = f'mnemonic("{mnemonic}", {union})'
 
-    # Create a temporary file for the query
-    with tempfile.NamedTemporaryFile(
-        mode="w", suffix=".txt", delete=False
-    ) as query_file:
-        query_file.write(query)
-        query_file_path = query_file.name
+    # Short queries are passed inline, only long ones need a query file
+    query_file_path = None
+    if len(query) < MAX_INLINE_QUERY_LENGTH:
+        query_args = [query]
+    else:
+        with tempfile.NamedTemporaryFile(
+            mode="w", suffix=".txt", delete=False
+        ) as query_file:
+            query_file.write(query)
+            query_file_path = query_file.name
+        query_args = ["--query_file", query_file_path]
 
     try:
-        aquery_cmd = [
-            "bazel",
-            "aquery",
-            "--query_file",
-            query_file_path,
-            "--aspects",
-            scip_const.ASPECT_SCIP_INDEX,
-            scip_const.ASPECT_OUTPUT_GROUPS,
-            "--output=jsonproto",
-            "--keep_going",
-        ]
-        action_out_json = utils.output(command=aquery_cmd, cwd=cwd)
+        # Use the same options as the sync build so bazel reuses its analysis
+        # cache instead of re-analyzing every target under a new configuration.
+        aquery_cmd = (
+            [
+                "bazel",
+                "aquery",
+                "--aspects",
+                scip_const.ASPECT_SCIP_INDEX,
+                scip_const.ASPECT_OUTPUT_GROUPS,
+                "--output=jsonproto",
+                "--keep_going",
+            ]
+            + scip_const.JAVA_VERSION_FLAGS
+            + query_args
+        )
+        # json decodes the raw bytes itself, skip the str copy of the output and
+        # drop the raw output as soon as it is parsed
+        action_graph = json.loads(utils.output_bytes(command=aquery_cmd, cwd=cwd))
         print(f"Processing action output...")
-        return _get_all_outputs(action_out_json)
+        return _get_all_outputs(action_graph)
     except Exception as e:
         return {}
+    finally:
+        if query_file_path:
+            utils.safe_delete(query_file_path)
 
 
-def _get_all_outputs(json_data):
-    """Get all outputs from the action json data."""
-    data = json.loads(json_data)
-    path_fragments = []
-    if "pathFragments" in data:
-        path_fragments = data["pathFragments"]
-    artifacts = {}
-    if "artifacts" in data:
-        artifacts = data["artifacts"]
-    actions = {}
-    if "actions" in data:
-        actions = data["actions"]
-    targets = []
-    if "targets" in data:
-        targets = data["targets"]
-
-    # Calculate thread pool size as half of available CPUs
-    max_workers = get_thread_pool_size()
-
-    # Create a manager for thread-safe shared objects
-    manager = multiprocessing.Manager()
-
-    # Pre-process path fragments to create a lookup dictionary for parent fragments
-    # This avoids repeated searches in the process_fragment function
-    parent_lookup = {}
-    for fragment in path_fragments:
-        parent_id = fragment.get("parentId")
-        if parent_id:
-            parent_lookup[fragment["id"]] = parent_id
-
-    # Create a dictionary to map fragment IDs to their labels for quick lookup
-    fragment_labels = {fragment["id"]: fragment["label"] for fragment in path_fragments}
-
-    # Create a thread-safe dictionary to map pathFragmentId to the full path
-    path_dict = manager.dict()
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-
-        def process_fragment(fragment):
-            """Process a single path fragment to build its full path."""
-            fragment_id = fragment["id"]
-
-            # Check if we've already processed this fragment
-            if fragment_id in path_dict:
-                return None
-
-            # Build the full path by traversing parent IDs
-            path_parts = []
-            current_id = fragment_id
-
-            # Collect all path parts by traversing up the parent chain
-            while current_id:
-                path_parts.append(fragment_labels[current_id])
-                current_id = parent_lookup.get(current_id)
-
-            # Combine path parts in reverse order (from root to leaf)
-            full_path = "/".join(reversed(path_parts))
-
-            return fragment_id, full_path
-
-        # Submit all fragments for processing
-        future_to_fragment = {
-            executor.submit(process_fragment, fragment): fragment
-            for fragment in path_fragments
-        }
-
-        # Collect results as they complete
-        for future in as_completed(future_to_fragment):
-            result = future.result()
-            if result:  # Skip None results (already processed fragments)
-                fragment_id, path = result
-                path_dict[fragment_id] = path
+def _get_all_outputs(action_graph: dict) -> dict[str, dict[str, list[str]]]:
+    """
+    Get all outputs from the parsed action graph. The graph's lists are taken
+    out of it and released once they are resolved to keep the peak memory down.
+    """
+    path_fragments = action_graph.pop("pathFragments", [])
+    artifacts = action_graph.pop("artifacts", [])
+    actions = action_graph.pop("actions", [])
+    targets = action_graph.pop("targets", [])
+
+    # Everything below is plain dict work, which threads cannot speed up under
+    # the GIL, so it is done in a single pass each
+
+    # Index the fragments once, keeping only the (parent id, label) pair of each
+    # row instead of two lookups over the decoded dicts. Directory names repeat
+    # all over the output tree, intern them so each is stored once.
+    fragments = {
+        fragment["id"]: (fragment.get("parentId"), sys.intern(fragment["label"]))
+        for fragment in path_fragments
+    }
+    del path_fragments
 
     # Create a dictionary to map artifactId to pathFragmentId
-    artifact_dict = {
+    artifact_fragments = {
         artifact["id"]: artifact["pathFragmentId"] for artifact in artifacts
     }
+    del artifacts
 
-    # Optimize the target output dictionary creation
     # Group actions by target ID to reduce dictionary updates
-    target_output_dict = {}
+    target_output_dict = defaultdict(lambda: defaultdict(list))
     for action in actions:
-        target_id = action["targetId"]
-        if target_id not in target_output_dict:
-            target_output_dict[target_id] = {}
-        if action["mnemonic"] not in target_output_dict[target_id]:
-            target_output_dict[target_id][action["mnemonic"]] = []
-        target_output_dict[target_id][action["mnemonic"]].extend(action["outputIds"])
-
-    # Create a thread-safe dictionary for the final output
-    target_output_paths = manager.dict()
-
-    # Batch targets for processing to reduce thread overhead
-    batch_size = max(1, len(targets) // (max_workers * 2))
-    target_batches = [
-        targets[i : i + batch_size] for i in range(0, len(targets), batch_size)
-    ]
-
-    def process_target_batch(target_batch):
-        """Process a batch of targets to build their output paths."""
-        batch_results = {}
-
-        for target in target_batch:
-            target_id = target["id"]
-            target_label = target["label"]
-
-            mnemonic_to_output_ids = target_output_dict.get(target_id, {})
-            target_results = {}
-
-            for mnemonic, output_ids in mnemonic_to_output_ids.items():
-                # Use list comprehension with pre-filtering to improve performance
-                valid_output_ids = [oid for oid in output_ids if oid in artifact_dict]
-                output_paths = [
-                    path_dict[artifact_dict[oid]] for oid in valid_output_ids
-                ]
-
-                if output_paths:  # Only add non-empty results
-                    target_results[mnemonic] = output_paths
-
-            if target_results:  # Only add targets with results
-                batch_results[target_label] = target_results
-
-        return batch_results
-
-    # Process target batches in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        batch_results = list(executor.map(process_target_batch, target_batches))
+        target_output_dict[action["targetId"]][action["mnemonic"]].extend(
+            action["outputIds"]
+        )
+    del actions
+
+    # Map pathFragmentId to the full path, only for the fragments of the outputs
+    # we report, most artifacts are inputs. Fragments share long parent chains,
+    # so walk up only to the first ancestor with a known path and fill in the
+    # fragments passed on the way back down
+    path_dict = {}
+
+    def resolve_path(fragment_id):
+        pending = []
+        current_id = fragment_id
+        while current_id and current_id not in path_dict:
+            pending.append(current_id)
+            current_id = fragments[current_id][0]
+
+        parent_path = path_dict.get(current_id)
+        for pending_id in reversed(pending):
+            label = fragments[pending_id][1]
+            parent_path = label if parent_path is None else parent_path + "/" + label
+            path_dict[pending_id] = parent_path
+        return path_dict[fragment_id]
 
-    # Merge all batch results into the final dictionary
     final_results = {}
-    for batch_result in batch_results:
-        for target_label, mnemonics in batch_result.items():
-            if target_label not in final_results:
-                final_results[target_label] = {}
-            for mnemonic, paths in mnemonics.items():
-                if mnemonic not in final_results[target_label]:
-                    final_results[target_label][mnemonic] = []
-                final_results[target_label][mnemonic].extend(paths)
+    for target in targets:
+        mnemonic_to_output_ids = target_output_dict.get(target["id"], {})
+        for mnemonic, output_ids in mnemonic_to_output_ids.items():
+            output_paths = [
+                resolve_path(artifact_fragments[oid])
+                for oid in output_ids
+                if oid in artifact_fragments
+            ]
+            if output_paths:  # Only add non-empty results
+                final_results.setdefault(target["label"], {}).setdefault(
+                    mnemonic, []
+                ).extend(output_paths)
 
     return final_results
 
@@ -276,8 +277,24 @@ def get_thread_pool_size() -> int:
     return max(1, multiprocessing.cpu_count() // 2)
 
 
+@lru_cache(maxsize=1)
+def get_io_thread_pool_size() -> int:
+    """Thread pool size for work that mostly waits on file system calls."""
+    return min(32, multiprocessing.cpu_count() + 4)
+
+
+@lru_cache(maxsize=1)
+def get_io_executor() -> ThreadPoolExecutor:
+    """Process wide pool for file system work, threads are started on demand."""
+    return ThreadPoolExecutor(
+        max_workers=get_io_thread_pool_size(), thread_name_prefix="scip-io"
+    )
+
+
 def copy_index(index_to_copy: set[str], dest: str) -> None:
     utils.safe_create(dest, is_dir=True)
+    # Index names are flat file names, prefix them directly per index
+    dest_prefix = dest.rstrip(os.path.sep) + os.path.sep
 
     def process_and_copy_scip_index(
         source_path: str, current_status: dict
@@ -287,141 +304,138 @@ def copy_index(index_to_copy: set[str], dest: str) -> None:
             source_sha_path = source_path + scip_const.SHA256_FILE_SUFFIX
             relative_path = source_path.split(os.path.sep + "bin" + os.path.sep)[-1]
             scip_index_name = relative_path.replace("/", "_").replace("-", "_")
-            new_sha = get_sha256_for_file(source_sha_path)
-
-            # Check if copy needed
-            if (
-                scip_index_name in current_status
-                and current_status[scip_index_name] == new_sha
-            ):
-                return (
-                    scip_index_name,
-                    scip_index_name + scip_const.SHA256_FILE_SUFFIX,
-                )
-
-            # Copy files if needed
-            dest_index_path = os.path.join(dest, scip_index_name)
-            shutil.copy(source_path, dest_index_path)
-            shutil.copy(
+            kept_files = (
+                scip_index_name,
+                scip_index_name + scip_const.SHA256_FILE_SUFFIX,
+            )
+
+            dest_index_path = dest_prefix + scip_index_name
+            source_stat = os.stat(source_path)
+            source_times = (source_stat.st_atime_ns, source_stat.st_mtime_ns)
+
+            # Check if copy needed. Copies carry the source mtime, an index whose
+            # size and mtime still match its copy is unchanged and its sha file
+            # is not read
+            if scip_index_name in current_status:
+                dest_stat = dest_entries[scip_index_name].stat()
+                if (source_stat.st_size, source_stat.st_mtime_ns) == (
+                    dest_stat.st_size,
+                    dest_stat.st_mtime_ns,
+                ):
+                    return kept_files
+
+                new_sha = get_sha256_for_file(source_sha_path)
+                if current_status[scip_index_name] == new_sha:
+                    # Same content, take over the mtime so the next sync skips it
+                    os.utime(dest_index_path, ns=source_times)
+                    return kept_files
+
+            # Copy files if needed, the mtime is set last so an interrupted copy
+            # is not mistaken for a complete one
+            utils.copy_file(source_path, dest_index_path)
+            utils.copy_file(
                 source_sha_path, dest_index_path + scip_const.SHA256_FILE_SUFFIX
             )
-            return (scip_index_name, scip_index_name + scip_const.SHA256_FILE_SUFFIX)
+            os.utime(dest_index_path, ns=source_times)
+            return kept_files
         except Exception as e:
             print(f"Failed to process index {source_path}: {str(e)}")
             return None
 
-    def get_current_status(filename: str) -> tuple[str, str]:
-        if not filename.endswith(".scip"):
-            return None, None
-        sha = get_sha256_for_file(
-            os.path.join(dest, filename + scip_const.SHA256_FILE_SUFFIX)
-        )
-        return (filename, sha) if sha else (None, None)
-
-    with ThreadPoolExecutor(max_workers=get_thread_pool_size()) as executor:
-        # Get current status
-        current_status = dict(
-            filter(
-                None,
-                executor.map(
-                    get_current_status,
-                    [f for f in os.listdir(dest) if f.endswith(".scip")],
-                ),
-            )
+    # List dest once, the entries carry their file type for the cleanup below
+    with os.scandir(dest) as it:
+        dest_entries = {entry.name: entry for entry in it}
+
+    # Get current status, reading the small sha files inline is cheaper than
+    # scheduling them on the pool
+    current_status = _load_sha_cache(dest_entries)
+
+    # The work here is file system calls that release the GIL, run it on the
+    # shared I/O pool instead of starting threads for every call
+    executor = get_io_executor()
+
+    # Process and copy files
+    copy_results = list(
+        filter(
+            None,
+            executor.map(
+                lambda src: process_and_copy_scip_index(src, current_status),
+                index_to_copy,
+            ),
         )
+    )
 
-        # Process and copy files
-        copy_results = list(
-            filter(
-                None,
-                executor.map(
-                    lambda src: process_and_copy_scip_index(src, current_status),
-                    index_to_copy,
+    # Delete old files
+    files_to_keep = {name for pair in copy_results for name in pair}
+    files_to_delete = (
+        dest_entries.keys()
+        - files_to_keep
+        - {scip_const.WORKSPACE_FILE_NAME, scip_const.CACHE_DIR}
+    )
+    files_to_delete = {
+        f for f in files_to_delete if not f.startswith(scip_const.JDK_SCIP_FILE_PREFIX)
+    }
+
+    if files_to_delete:
+        list(
+            executor.map(
+                lambda f: (
+                    shutil.rmtree(dest_entries[f].path)
+                    if dest_entries[f].is_dir(follow_symlinks=False)
+                    else os.remove(dest_entries[f].path)
                 ),
+                files_to_delete,
             )
         )
 
-        # Delete old files
-        files_to_keep = {name for pair in copy_results for name in pair}
-        files_to_delete = (
-            set(os.listdir(dest)) - files_to_keep - {scip_const.WORKSPACE_FILE_NAME}
-        )
-        files_to_delete = {
-            f
-            for f in files_to_delete
-            if not f.startswith(scip_const.JDK_SCIP_FILE_PREFIX)
-        }
 
-        if files_to_delete:
-            list(
-                executor.map(
-                    lambda f: (
-                        os.remove(os.path.join(dest, f))
-                        if os.path.isfile(os.path.join(dest, f))
-                        else shutil.rmtree(os.path.join(dest, f))
-                    ),
-                    files_to_delete,
-                )
-            )
+def _load_sha_cache(dest_entries: dict[str, os.DirEntry]) -> dict[str, str]:
+    """
+    Read the sha files of the indexes in an already listed directory, keyed by
+    index name. Only the indexes with a sha file next to them are returned.
+    """
+    sha_cache = {}
+    for filename, entry in dest_entries.items():
+        if not filename.endswith(".scip" + scip_const.SHA256_FILE_SUFFIX):
+            continue
+        index_name = filename[: -len(scip_const.SHA256_FILE_SUFFIX)]
+        if index_name not in dest_entries:
+            continue
+        sha = get_sha256_for_file(entry.path)
+        if sha:
+            sha_cache[index_name] = sha
+    return sha_cache
 
 
-def transform_bazel_query_results(qr: list[dict]) -> dict[str, dict[str, list[str]]]:
+def transform_bazel_query_results(
+    qr: Iterable[dict],
+) -> dict[str, dict[str, list[str]]]:
     """Transform the results of a bazel query into a dictionary of dependencies."""
     res = {}
 
-    rules = set([])
-
-    for target in qr:
-        if target["type"] == "RULE":
-            rules.add(target["rule"]["name"])
-
-    for target in qr:
-        if target["type"] != "RULE":
-            continue
+    # qr may be a stream, keep only the fields used below from a single pass so
+    # the raw records (locations, srcs, ...) can be dropped as they arrive
+    rule_entries = [
+        _extract_rule_fields(target["rule"])
+        for target in qr
+        if target["type"] == "RULE"
+    ]
+    rules = {entry[0] for entry in rule_entries}
 
-        rule = target["rule"]
-        name = rule["name"]
-        base_path = rule["name"].split(":")[0][2:]
+    for name, target_type, rule_inputs, attr_deps, e_deps in rule_entries:
+        base_path = name.partition(":")[0][2:]
 
         # add all rule inputs except external repository
         # to deps
-        direct_deps = []
-
-        for dep in rule.get("ruleInput", []):
-            if dep.startswith("@"):
-                continue
-            if dep not in rules:
-                continue
-
-            direct_deps.append(dep)
-
-        target_type = rule["ruleClass"]
-
-        e_deps = []
-        deps = []
-        for attr in rule.get("attribute", []):
-            if "stringListValue" not in attr:
-                continue
-            if attr["name"] == "deps":
-                deps += [
-                    dep
-                    for dep in attr.get("stringListValue", [])
-                    if not dep.startswith("@") and dep in rules
-                ]
-
-            if attr["name"] == "data":
-                deps += [
-                    data
-                    for data in attr.get("stringListValue", [])
-                    if not data.startswith("@") and data in rules
-                ]
-
-            if attr["name"] == "exports":
-                e_deps = attr.get("stringListValue", [])
+        direct_deps = [
+            dep for dep in rule_inputs if not dep.startswith("@") and dep in rules
+        ]
+        # deps and data can name the same label, dedup while filtering
+        deps = {dep for dep in attr_deps if not dep.startswith("@") and dep in rules}
 
         info = {
             "base_path": base_path,
-            "deps": list(set(deps)),
+            "deps": list(deps),
             "direct_deps": direct_deps,
             "exports": e_deps,
             "target_type": target_type,
@@ -432,48 +446,100 @@ def transform_bazel_query_results(qr: list[dict]) -> dict[str, dict[str, list[st
     return res
 
 
-def filter_list_by_regex(list_to_filter: set[str], regex_set: set[str]) -> set[str]:
-    """Filters a list based on regex patterns from another list."""
+def _extract_rule_fields(
+    rule: dict,
+) -> tuple[str, str, list[str], list[str], list[str]]:
+    """Extract (name, rule class, rule inputs, deps and data, exports) of a rule."""
+    # labels repeat across many rules, intern them so the graph shares one
+    # copy of each label and lookups can short-circuit on identity
+    deps = []
+    e_deps = []
+    for attr in rule.get("attribute", []):
+        if "stringListValue" not in attr:
+            continue
+        if attr["name"] in ("deps", "data"):
+            deps += [sys.intern(dep) for dep in attr["stringListValue"]]
+        elif attr["name"] == "exports":
+            e_deps = [sys.intern(e) for e in attr["stringListValue"]]
+
+    return (
+        sys.intern(rule["name"]),
+        sys.intern(rule["ruleClass"]),
+        [sys.intern(dep) for dep in rule.get("ruleInput", [])],
+        deps,
+        e_deps,
+    )
+
+
+def compile_regex_set(regex_set: Iterable[str]) -> Optional[re.Pattern]:
+    """Compile regex patterns into a single alternation, None if there are none."""
+    if not regex_set:
+        return None
+    # Sorted so the same set always yields the same pattern string, which lets
+    # re's compile cache serve repeated calls
+    return re.compile(
+        "|".join(f"(?:{regex_pattern})" for regex_pattern in sorted(set(regex_set)))
+    )
 
-    filtered_list = set()
-    for regex_pattern in regex_set:
-        for item in list_to_filter:
-            if re.search(regex_pattern, item):
-                filtered_list.add(item)
 
-    return filtered_list
+def filter_list_by_regex(
+    list_to_filter: Iterable[str], regex_set: Union[set[str], re.Pattern, None]
+) -> set[str]:
+    """
+    Filters a list based on regex patterns from another list. The patterns can
+    be passed precompiled with compile_regex_set to reuse them across calls.
+    """
+    if regex_set is None or isinstance(regex_set, re.Pattern):
+        pattern = regex_set
+    else:
+        pattern = compile_regex_set(regex_set)
 
+    if pattern is None:
+        return set()
 
-def dfs(
-    dep_graph: dict[str, dict[str, list[str]]], target: str, depth: int
-) -> list[str]:
+    return {item for item in list_to_filter if pattern.search(item)}
+
+
+def collect_dependencies(
+    dep_graph: dict[str, dict[str, list[str]]], targets: Iterable[str], depth: int
+) -> set[str]:
     """
-    Run a depth-first search on a dependency graph. Returns a list of targets.
-    Will stop at the specified depth. Depth is ignored if the target is exported.
+    Collect the dependencies of the given targets in a single breadth-first
+    walk. Will stop at the specified depth. Depth is ignored if the target is
+    exported. Subgraphs shared between targets are expanded only once, with
+    the largest depth they are reached with.
 
     :param dep_graph : A dictionary of dependencies.
-    :param target: The target to start the search from.
+    :param targets: The targets to start the search from.
     :param depth: The depth to search to.
-    :return: A list of targets.
+    :return: A set of targets.
     """
-    result = []
-    if target not in dep_graph:
-        return result
+    result = set()
+    # Deepest expansion per target, below zero only exports are followed so
+    # all negative depths are equivalent. This also stops export cycles.
+    expanded = {}
+    queue = deque((target, depth) for target in targets)
+    while queue:
+        target, remaining = queue.popleft()
+        remaining = max(remaining, -1)
+        if target not in dep_graph or expanded.get(target, -2) >= remaining:
+            continue
+        expanded[target] = remaining
 
-    for exported_dep in dep_graph[target]["exports"]:
-        result.append(exported_dep)
-        result.extend(dfs(dep_graph, exported_dep, depth - 1))
+        for exported_dep in dep_graph[target]["exports"]:
+            result.add(exported_dep)
+            queue.append((exported_dep, remaining - 1))
 
-    if depth < 0:
-        return result
+        if remaining < 0:
+            continue
 
-    result.extend([target])
+        result.add(target)
 
-    if depth == 0:
-        return result
+        if remaining == 0:
+            continue
 
-    for dep in dep_graph[target]["direct_deps"]:
-        result.append(dep)
-        result.extend(dfs(dep_graph, dep, depth - 1))
+        for dep in dep_graph[target]["direct_deps"]:
+            result.add(dep)
+            queue.append((dep, remaining - 1))
 
     return result
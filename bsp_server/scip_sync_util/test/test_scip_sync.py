@@ -1,9 +1,10 @@
 import argparse
+import copy
 import os.path
 import tempfile
 import unittest
-from datetime import datetime
-from unittest.mock import MagicMock, call, patch
+from types import MappingProxyType
+from unittest.mock import DEFAULT, MagicMock, call, patch
 
 from bsp_server.scip_sync_util import scip_const, scip_sync
 from bsp_server.scip_sync_util.mnemonics import ScipMnemonics
@@ -15,438 +16,385 @@ from bsp_server.scip_sync_util.scip_const import (
     TARGETS,
 )
 from bsp_server.scip_sync_util.workspace import ScipWorkspace
+from bsp_server.util import utils
+
+_EXPORTED_ROOTS = frozenset(
+    {
+        "//path/to:target1",
+        "//path/to:target2",
+        "//path/to:export1",
+        "//path/to:export2",
+        "//path/to:export3",
+    }
+)
+_PATH_TO_PACKAGE = _EXPORTED_ROOTS | {"//path/to:dep1"}
+_DEPTH_ONE = _PATH_TO_PACKAGE | {"//path/other:dep2"}
+_ALL_TARGETS = _DEPTH_ONE | {"//path/new:dep3"}
 
 
-class TestScipSync(unittest.TestCase):
+def _mnemonic_output(target, source_list):
+    return {
+        target: {
+            ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value: ("index1",),
+            ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: ("manifest1",),
+            ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: (source_list,),
+        }
+    }
+
+
+class TestScipSyncMain(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._default_args = argparse.Namespace(
+            cwd="/path/to/cwd",
+            targets=[],
+            filepath=None,
+            depth=1,
+            use_cache=False,
+        )
+
+    def _mk_args(self, **overrides):
+        return argparse.Namespace(**{**vars(self._default_args), **overrides})
+
+    def _assert_none_called(self, *mocks):
+        called = [mock for mock in mocks if mock.call_count]
+        self.assertFalse(called, f"unexpectedly called: {called}")
+
     def setUp(self):
-        self.temp_dir = tempfile.mkdtemp()
-        self.mock_datetime = datetime(2024, 4, 19, 12, 0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.temp_dir = self.tmp.name
+        self.mock_time = 1000.0
         self.cwd = "/path/to/cwd"
         self.scip_dir = os.path.join(self.cwd, ".scip")
+        self.source_list = os.path.join(self.temp_dir, "source_list")
+
+        self.m = {}
+        for patcher in (
+            patch.multiple(
+                "bsp_server.scip_sync_util.scip_sync",
+                pprint=DEFAULT,
+                sync_scip=DEFAULT,
+                get_dependency_graph=DEFAULT,
+                fetch_targets_from_bazelproject=DEFAULT,
+                time=DEFAULT,
+            ),
+            patch.multiple(
+                "bsp_server.scip_sync_util.scip_sync.scip_utils",
+                copy_index=DEFAULT,
+                get_mnemonic_output=DEFAULT,
+                get_containing_bazel_target=DEFAULT,
+            ),
+            patch.multiple(
+                "bsp_server.scip_sync_util.scip_sync.scip_workspace",
+                write_workspace=DEFAULT,
+                populate_workspace=DEFAULT,
+                get_manifest_for_file=DEFAULT,
+            ),
+            patch.multiple(argparse.ArgumentParser, parse_args=DEFAULT),
+            patch.multiple(os.path, exists=DEFAULT),
+        ):
+            self.m.update(patcher.start())
+            self.addCleanup(patcher.stop)
 
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.fetch_targets_from_bazelproject")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    @patch("os.path.exists")
-    def test_main_no_targets_no_filepath(
-        self,
-        mock_exists,
-        mock_datetime,
-        mock_parse_args,
-        mock_fetch_targets,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+        self.m["time"].monotonic.return_value = self.mock_time
+        self.m["exists"].return_value = True
+
+    def test_main_no_targets_no_filepath(self):
         """Test case 1: No targets or filepath provided - should rewrite workspace"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=[],
-            filepath=None,
-            depth=1,
+        self.m["parse_args"].return_value = self._mk_args()
+        self.m["fetch_targets_from_bazelproject"].return_value = set("//target1"), set(
+            "//target2"
         )
-        mock_fetch_targets.return_value = set("//target1"), set("//target2")
-        mock_get_dependency_graph.return_value = {"//target1", "//target2"}
+        self.m["get_dependency_graph"].return_value = {"//target1", "//target2"}
 
         # Mock outputs
-        source_list = "/tmp/source_list"
-        with open(source_list, "w") as f:
-            f.write("file1.java\nfile2.java")
-
-        mock_get_mnemonic_output.return_value = {
-            "//target1": {
-                ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value: ["index1"],
-                ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: ["manifest1"],
-                ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: [source_list],
-            }
-        }
-
-        mock_exists.return_value = True
+        self.m["get_mnemonic_output"].return_value = _mnemonic_output(
+            "//target1", self.source_list
+        )
 
         # Mock workspace
-        workspace = ScipWorkspace()
-        mock_populate_workspace.return_value = workspace
+        workspace = MagicMock(spec=ScipWorkspace)
+        self.m["populate_workspace"].return_value = workspace
 
         # Run the function
         scip_sync.main()
 
         # Verify
-        mock_fetch_targets.assert_called_once_with(self.cwd)
-        mock_get_dependency_graph.assert_called_once_with(
+        self.m["fetch_targets_from_bazelproject"].assert_called_once_with(self.cwd)
+        self.m["get_dependency_graph"].assert_called_once_with(
             cwd=self.cwd,
             targets=set("//target1"),
             depth=1,
             exclude_targets=set("//target2"),
         )
-        mock_sync_scip.assert_called_once()
-        mock_get_mnemonic_output.assert_called_once()
-        mock_populate_workspace.assert_called_once_with(
-            self.cwd, mock_get_mnemonic_output.return_value
+        self.m["sync_scip"].assert_called_once()
+        self.m["get_mnemonic_output"].assert_called_once()
+        self.m["populate_workspace"].assert_called_once_with(
+            self.cwd, self.m["get_mnemonic_output"].return_value
         )
 
         # Verify workspace is written with merge=False
-        mock_write_workspace.assert_called_once_with(workspace, self.scip_dir)
+        self.m["write_workspace"].assert_called_once_with(workspace, self.scip_dir)
 
         # Verify indexes are copied
-        mock_copy_index.assert_called_once()
-
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.fetch_targets_from_bazelproject")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    @patch("os.path.exists")
-    def test_main_with_targets(
-        self,
-        mock_exists,
-        mock_datetime,
-        mock_parse_args,
-        mock_fetch_targets,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+        self.m["copy_index"].assert_called_once()
+
+    def test_main_with_targets(self):
         """Test case 2: Targets provided - should merge workspace"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=["//target1"],
-            filepath=None,
-            depth=1,
-        )
-        mock_get_dependency_graph.return_value = {"//target1", "//target2"}
+        self.m["parse_args"].return_value = self._mk_args(targets=["//target1"])
+        self.m["get_dependency_graph"].return_value = {"//target1", "//target2"}
 
         # Mock outputs
-        source_list = "/tmp/source_list"
-        with open(source_list, "w") as f:
-            f.write("file1.java\nfile2.java")
-
-        mock_get_mnemonic_output.return_value = {
-            "//target1": {
-                ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value: ["index1"],
-                ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: ["manifest1"],
-                ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: [source_list],
-            }
-        }
-
-        mock_exists.return_value = True
+        self.m["get_mnemonic_output"].return_value = _mnemonic_output(
+            "//target1", self.source_list
+        )
 
         # Mock workspace
-        workspace = ScipWorkspace()
-        mock_populate_workspace.return_value = workspace
+        workspace = MagicMock(spec=ScipWorkspace)
+        self.m["populate_workspace"].return_value = workspace
 
         # Run the function
         scip_sync.main()
 
         # Verify
-        mock_fetch_targets.assert_not_called()  # Should not fetch targets from bazelproject
-        mock_get_dependency_graph.assert_called_once_with(
+        # Should not fetch targets from bazelproject
+        self.m["fetch_targets_from_bazelproject"].assert_not_called()
+        self.m["get_dependency_graph"].assert_called_once_with(
             cwd="/path/to/cwd", targets=["//target1"], depth=1, exclude_targets=set()
         )
-        mock_sync_scip.assert_called_once()
-        mock_get_mnemonic_output.assert_called_once()
-        mock_populate_workspace.assert_called_once_with(
-            self.cwd, mock_get_mnemonic_output.return_value
+        self.m["sync_scip"].assert_called_once()
+        self.m["get_mnemonic_output"].assert_called_once()
+        self.m["populate_workspace"].assert_called_once_with(
+            self.cwd, self.m["get_mnemonic_output"].return_value
         )
 
         # Verify workspace is written with merge=True
-        mock_write_workspace.assert_called_once_with(workspace, self.scip_dir)
+        self.m["write_workspace"].assert_called_once_with(workspace, self.scip_dir)
 
         # Verify indexes are copied
-        mock_copy_index.assert_called_once()
-
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_containing_bazel_target")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.get_manifest_for_file")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    @patch("os.path.exists")
-    def test_main_with_filepath_not_in_workspace(
-        self,
-        mock_exists,
-        mock_datetime,
-        mock_parse_args,
-        mock_get_manifest_for_file,
-        mock_get_containing_bazel_target,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+        self.m["copy_index"].assert_called_once()
+
+    def test_main_with_filepath_not_in_workspace(self):
         """Test case 3: Filepath provided not in workspace - should return early"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
         filepath = f"{self.cwd}/src/main/java/com/example/File.java"
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=[],
-            filepath=filepath,
-            depth=1,
-        )
+        self.m["parse_args"].return_value = self._mk_args(filepath=filepath)
 
         # File not in workspace
-        mock_get_manifest_for_file.return_value = (None, None)
+        self.m["get_manifest_for_file"].return_value = (None, None)
 
         # Target for the file
         target = "//src/main/java/com/example:target"
-        mock_get_containing_bazel_target.return_value = target
+        self.m["get_containing_bazel_target"].return_value = target
 
         # Dependency graph
-        mock_get_dependency_graph.return_value = {target}
+        self.m["get_dependency_graph"].return_value = {target}
 
         # Mock outputs
-        source_list = "/tmp/source_list"
-        with open(source_list, "w") as f:
-            f.write("src/main/java/com/example/File.java")
-
-        mock_get_mnemonic_output.return_value = {
-            target: {
-                ScipMnemonics.INDEX_OUTPUT_MNEMONIC.value: ["index1"],
-                ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: ["manifest1"],
-                ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: [source_list],
-            }
-        }
-
-        mock_exists.return_value = True
+        self.m["get_mnemonic_output"].return_value = _mnemonic_output(
+            target, self.source_list
+        )
 
         # Mock workspace
-        workspace = ScipWorkspace()
-        mock_populate_workspace.return_value = workspace
+        workspace = MagicMock(spec=ScipWorkspace)
+        self.m["populate_workspace"].return_value = workspace
 
         # Run the function
         scip_sync.main()
 
         # Verify
         # 1. Check that get_manifest_for_file was called with the correct arguments
-        mock_get_manifest_for_file.assert_called_once_with(
+        self.m["get_manifest_for_file"].assert_called_once_with(
             "src/main/java/com/example/File.java",  # Relative path
             self.scip_dir,
         )
 
-        mock_get_containing_bazel_target.assert_not_called()
-        mock_get_dependency_graph.assert_not_called()
-        mock_sync_scip.assert_not_called()
-        mock_populate_workspace.assert_not_called()
-        mock_write_workspace.assert_not_called()
-        mock_copy_index.assert_not_called()
-
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_containing_bazel_target")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.get_manifest_for_file")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    def test_main_with_filepath_already_in_workspace(
-        self,
-        mock_datetime,
-        mock_parse_args,
-        mock_get_manifest_for_file,
-        mock_get_containing_bazel_target,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+        self._assert_none_called(
+            self.m["get_containing_bazel_target"],
+            self.m["get_dependency_graph"],
+            self.m["sync_scip"],
+            self.m["populate_workspace"],
+            self.m["write_workspace"],
+            self.m["copy_index"],
+        )
+
+    def test_main_with_filepath_already_in_workspace(self):
         """Test case 4: Filepath provided already in workspace - should return early"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
         filepath = f"{self.cwd}/src/main/java/com/example/File.java"
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=[],
-            filepath=filepath,
-            depth=1,
-        )
+        self.m["parse_args"].return_value = self._mk_args(filepath=filepath)
 
         # File already in workspace
-        mock_get_manifest_for_file.return_value = ("manifest1", "src/main/java")
+        self.m["get_manifest_for_file"].return_value = ("manifest1", "src/main/java")
 
         # Run the function
         scip_sync.main()
 
         # Verify
         # 1. Check that get_manifest_for_file was called with the correct arguments
-        mock_get_manifest_for_file.assert_called_once_with(
+        self.m["get_manifest_for_file"].assert_called_once_with(
             "src/main/java/com/example/File.java",  # Relative path
             self.scip_dir,
         )
 
-        # 2. Check that no other functions were called since the file is already in workspace
-        # mock_get_containing_bazel_target.assert_not_called()
-        # mock_get_dependency_graph.assert_not_called()
-        # mock_sync_scip.assert_not_called()
-        # mock_get_mnemonic_output.assert_not_called()
-        # mock_populate_workspace.assert_not_called()
-        # mock_write_workspace.assert_not_called()
-        # mock_copy_index.assert_not_called()
-        # mock_pprint.assert_not_called()
-
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_containing_bazel_target")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.get_manifest_for_file")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    def test_main_with_filepath_no_target_found(
-        self,
-        mock_datetime,
-        mock_parse_args,
-        mock_get_manifest_for_file,
-        mock_get_containing_bazel_target,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+    def test_main_with_filepath_no_target_found(self):
         """Test case 5: Filepath provided but no target found - should return early"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
         filepath = f"{self.cwd}/src/main/java/com/example/File.java"
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=[],
-            filepath=filepath,
-            depth=1,
-        )
+        self.m["parse_args"].return_value = self._mk_args(filepath=filepath)
 
         # File not in workspace
-        mock_get_manifest_for_file.return_value = (None, None)
+        self.m["get_manifest_for_file"].return_value = (None, None)
 
         # No target found for the file
-        mock_get_containing_bazel_target.return_value = None
+        self.m["get_containing_bazel_target"].return_value = None
 
         # Run the function
         scip_sync.main()
 
         # Verify
         # 1. Check that get_manifest_for_file was called with the correct arguments
-        mock_get_manifest_for_file.assert_called_once_with(
+        self.m["get_manifest_for_file"].assert_called_once_with(
             "src/main/java/com/example/File.java",  # Relative path
             self.scip_dir,
         )
 
-        mock_get_containing_bazel_target.assert_not_called()
-        mock_get_dependency_graph.assert_not_called()
-        mock_sync_scip.assert_not_called()
-        mock_get_mnemonic_output.assert_not_called()
-        mock_populate_workspace.assert_not_called()
-        mock_write_workspace.assert_not_called()
-        mock_copy_index.assert_not_called()
-        mock_pprint.assert_not_called()
-
-    @patch("bsp_server.scip_sync_util.scip_sync.pprint")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.write_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.populate_workspace")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.get_mnemonic_output")
-    @patch("bsp_server.scip_sync_util.scip_sync.sync_scip")
-    @patch("bsp_server.scip_sync_util.scip_sync.get_dependency_graph")
-    @patch("bsp_server.scip_sync_util.scip_sync.fetch_targets_from_bazelproject")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    def test_main_no_buildable_targets(
-        self,
-        mock_datetime,
-        mock_parse_args,
-        mock_fetch_targets,
-        mock_get_dependency_graph,
-        mock_sync_scip,
-        mock_get_mnemonic_output,
-        mock_populate_workspace,
-        mock_write_workspace,
-        mock_copy_index,
-        mock_pprint,
-    ):
+        self._assert_none_called(
+            self.m["get_containing_bazel_target"],
+            self.m["get_dependency_graph"],
+            self.m["sync_scip"],
+            self.m["get_mnemonic_output"],
+            self.m["populate_workspace"],
+            self.m["write_workspace"],
+            self.m["copy_index"],
+            self.m["pprint"],
+        )
+
+    def test_main_no_buildable_targets(self):
         """Test case 6: No buildable targets found - should return early"""
         # Setup
-        mock_datetime.now.return_value = self.mock_datetime
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=["//target1"],
-            filepath=None,
-            depth=1,
-        )
+        self.m["parse_args"].return_value = self._mk_args(targets=["//target1"])
 
         # No buildable targets
-        mock_get_dependency_graph.return_value = set()
+        self.m["get_dependency_graph"].return_value = set()
 
         # Run the function
         scip_sync.main()
 
         # Verify
-        mock_get_dependency_graph.assert_called_once_with(
+        self.m["get_dependency_graph"].assert_called_once_with(
             cwd="/path/to/cwd", targets=["//target1"], depth=1, exclude_targets=set()
         )
 
         # Check that no other functions were called since no buildable targets were found
-        mock_sync_scip.assert_not_called()
-        mock_get_mnemonic_output.assert_not_called()
-        mock_populate_workspace.assert_not_called()
-        mock_write_workspace.assert_not_called()
-        mock_copy_index.assert_not_called()
-        mock_pprint.assert_not_called()
+        self._assert_none_called(
+            self.m["sync_scip"],
+            self.m["get_mnemonic_output"],
+            self.m["populate_workspace"],
+            self.m["write_workspace"],
+            self.m["copy_index"],
+            self.m["pprint"],
+        )
+
+    def test_main_use_cache_miss_writes_cache(self):
+        """Test case 7: --use_cache without a cached graph - should query and write it"""
+        self.m["parse_args"].return_value = self._mk_args(
+            cwd=self.temp_dir, targets=["//target1"], use_cache=True
+        )
+        self.m["get_dependency_graph"].return_value = {"//target1", "//target2"}
+        self.m["get_mnemonic_output"].return_value = {}
+        # the cache directory is created on disk, os.makedirs needs the real exists
+        self.m["exists"].side_effect = os.path.lexists
+
+        scip_sync.main()
+
+        self.m["get_dependency_graph"].assert_called_once_with(
+            cwd=self.temp_dir, targets=["//target1"], depth=1, exclude_targets=set()
+        )
+        cache_path = scip_sync.get_dependency_graph_cache_path(
+            self.temp_dir, ["//target1"], set(), 1
+        )
+        self.assertEqual(
+            os.path.dirname(cache_path),
+            os.path.join(self.temp_dir, ".scip", scip_const.CACHE_DIR),
+        )
+        self.assertEqual(set(utils.get_json(cache_path)), {"//target1", "//target2"})
+
+    def test_main_use_cache_hit_skips_query(self):
+        """Test case 8: --use_cache with a cached graph - should skip the query"""
+        self.m["parse_args"].return_value = self._mk_args(
+            cwd=self.temp_dir, targets=["//target1"], use_cache=True
+        )
+        self.m["get_mnemonic_output"].return_value = {}
+        # the cache directory is created on disk, os.makedirs needs the real exists
+        self.m["exists"].side_effect = os.path.lexists
+        cache_path = scip_sync.get_dependency_graph_cache_path(
+            self.temp_dir, ["//target1"], set(), 1
+        )
+        utils.write_json(["//target1", "//target2"], cache_path)
+
+        scip_sync.main()
+
+        self.m["get_dependency_graph"].assert_not_called()
+        self.m["sync_scip"].assert_called_once()
+        self.assertEqual(
+            self.m["sync_scip"].call_args.args[1], {"//target1", "//target2"}
+        )
+
+    @patch("bsp_server.scip_sync_util.incremental.index_file")
+    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.old_copy_index")
+    def test_main_with_filepath_triggers_old_sync(
+        self, mock_old_copy_index, mock_index_file
+    ):
+        filepath = f"{self.cwd}/src/main/java/com/example/File.java"
+        self.m["parse_args"].return_value = self._mk_args(filepath=filepath)
+        manifest_tuple = ("manifest1", "src/main/java")
+        self.m["get_manifest_for_file"].return_value = manifest_tuple
+        mock_index_file.return_value = "generated_index_path"
+
+        # Run the function
+        scip_sync.main()
+
+        # Verify
+        self.m["get_manifest_for_file"].assert_called_once_with(
+            "src/main/java/com/example/File.java",  # Relative path
+            self.scip_dir,
+        )
+
+        mock_index_file.assert_called_once_with(
+            self.cwd, "src/main/java/com/example/File.java", manifest_tuple
+        )
+        mock_old_copy_index.assert_called_once_with(
+            {"generated_index_path"}, self.scip_dir
+        )
+
+
+class TestScipSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.temp_dir = self.tmp.name
+        self.mock_time = 1000.0
+        self.cwd = "/path/to/cwd"
+        self.scip_dir = os.path.join(self.cwd, ".scip")
 
+    @patch("bsp_server.util.utils.safe_delete")
     @patch("tempfile.NamedTemporaryFile")
-    @patch("bsp_server.util.utils.write_list")
     @patch("bsp_server.util.utils.output")
-    def test_scip_sync(self, m_output, m_write_list, m_tempfile):
-        m_tempfile.return_value.name = "mock_targets_file"
-        targets = {"//target:one", "//target:two"}
+    def test_scip_sync(self, m_output, m_tempfile, m_safe_delete):
+        m_targets_file = m_tempfile.return_value.__enter__.return_value
+        m_targets_file.name = "mock_targets_file"
+        targets = ["//target:one", "//target:two"]
         cwd = "/path/to/cwd"
-        dummy_stat = scip_sync.SyncStats()
+        dummy_stat = copy.copy(self._dummy_stat_template)
 
         scip_sync.sync_scip(cwd, targets, dummy_stat)
 
-        m_tempfile.assert_called_once_with(delete=False)
-        m_write_list.assert_called_once_with(targets, "mock_targets_file")
+        m_tempfile.assert_called_once_with(mode="w", delete=False)
+        m_targets_file.write.assert_called_once_with("//target:one\n//target:two\n")
         expected_build_tooling_cmd = [
             BAZEL,
             BUILD,
@@ -470,312 +418,176 @@ class TestScipSync(unittest.TestCase):
                 call(expected_cmd, cwd=cwd),
             ]
         )
+        m_safe_delete.assert_called_once_with("mock_targets_file")
 
-    @patch("os.path.exists")
-    @patch("os.path.join")
-    def test_file_not_found(self, m_join, m_exists):
-        m_exists.return_value = False
-        m_join.return_value = "/path/to/.bazelproject"
-
-        result = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(result, (set(), set()))
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-
-    @patch("os.path.exists")
-    @patch("os.path.join")
-    @patch("bsp_server.scip_sync_util.scip_utils.parse_bazelproject")
-    def test_targets_from_bazelproject_throws_exception(
-        self, m_parse, m_join, m_exists
-    ):
-        m_exists.return_value = True
-        m_join.return_value = "/path/to/.bazelproject"
-        m_parse.side_effect = Exception("Mocked exception")
-
-        result = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(result, (set(), set()))
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-        m_parse.assert_called_with("/path/to/.bazelproject")
-
-    @patch("os.path.exists")
-    @patch("os.path.join")
-    @patch("bsp_server.scip_sync_util.scip_utils.parse_bazelproject")
-    def test_targets_fetched_duplicates_with_derive_from_dirs_enabled(
-        self, m_parse, m_join, m_exists
-    ):
-        m_exists.return_value = True
-        m_join.return_value = "/path/to/.bazelproject"
-        m_parse.return_value = {
-            TARGETS: ["//target:one", "//target:two", "//path/to/dir1/..."],
-            DIRECTORIES: [".", "path/to/dir1", "path/to/dir2"],
-            DERIVE_TARGETS_FROM_DIRECTORIES: ["true"],
-        }
-
-        result, _ = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(
-            sorted(list(result)),
-            sorted(
-                [
-                    "//target:one",
-                    "//target:two",
-                    "//path/to/dir1/...",
-                    "//path/to/dir2/...",
-                ]
-            ),
-        )
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-        m_parse.assert_called_with("/path/to/.bazelproject")
-
-    @patch("os.path.exists")
-    @patch("os.path.join")
-    @patch("bsp_server.scip_sync_util.scip_utils.parse_bazelproject")
-    def test_targets_fetched_with_derive_from_dirs_enabled(
-        self, m_parse, m_join, m_exists
-    ):
-        m_exists.return_value = True
-        m_join.return_value = "/path/to/.bazelproject"
-        m_parse.return_value = {
-            TARGETS: ["//target:one", "//target:two"],
-            DIRECTORIES: [".", "path/to/dir1", "path/to/dir2"],
-            DERIVE_TARGETS_FROM_DIRECTORIES: ["true"],
-        }
-
-        result, _ = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(
-            sorted(list(result)),
-            sorted(
-                [
+    # (case, .bazelproject exists, parse_bazelproject result, targets, excludes)
+    BAZELPROJECT_CASES = [
+        ("file_not_found", False, None, set(), set()),
+        (
+            "parse_throws_exception",
+            True,
+            Exception("Mocked exception"),
+            set(),
+            set(),
+        ),
+        *(
+            (
+                case,
+                True,
+                {
+                    TARGETS: targets,
+                    DIRECTORIES: [".", "path/to/dir1", "path/to/dir2"],
+                    DERIVE_TARGETS_FROM_DIRECTORIES: ["true"],
+                },
+                {
                     "//target:one",
                     "//target:two",
                     "//path/to/dir1/...",
                     "//path/to/dir2/...",
-                ]
-            ),
-        )
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-        m_parse.assert_called_with("/path/to/.bazelproject")
-
-    @patch("os.path.exists")
-    @patch("os.path.join")
-    @patch("bsp_server.scip_sync_util.scip_utils.parse_bazelproject")
-    def test_targets_fetched_with_derive_from_dirs_disabled(
-        self, m_parse, m_join, m_exists
-    ):
-        m_exists.return_value = True
-        m_join.return_value = "/path/to/.bazelproject"
-        m_parse.return_value = {
-            TARGETS: ["//target:one", "//target:two", "-//target:three"],
-            DIRECTORIES: [".", "path/to/dir1", "path/to/dir2", "-path/to/dir3"],
-            DERIVE_TARGETS_FROM_DIRECTORIES: ["false"],
-        }
-
-        result, excludes = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(
-            sorted(list(result)),
-            sorted(
-                [
-                    "//target:one",
-                    "//target:two",
-                ]
-            ),
-        )
-        self.assertEqual(sorted(list(excludes)), ["//target:three"])
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-        m_parse.assert_called_with("/path/to/.bazelproject")
+                },
+                set(),
+            )
+            # a listed target already covered by a directory is not duplicated
+            for case, targets in (
+                ("derive_from_dirs_enabled", ["//target:one", "//target:two"]),
+                (
+                    "duplicates_with_derive_from_dirs_enabled",
+                    ["//target:one", "//target:two", "//path/to/dir1/..."],
+                ),
+            )
+        ),
+        (
+            "derive_from_dirs_disabled",
+            True,
+            {
+                TARGETS: ["//target:one", "//target:two", "-//target:three"],
+                DIRECTORIES: [".", "path/to/dir1", "path/to/dir2", "-path/to/dir3"],
+                DERIVE_TARGETS_FROM_DIRECTORIES: ["false"],
+            },
+            {"//target:one", "//target:two"},
+            {"//target:three"},
+        ),
+        (
+            "exclusions_defined_derive_from_dirs_enabled",
+            True,
+            {
+                TARGETS: ["//target:one", "//target:two", "-//target:three"],
+                DIRECTORIES: [".", "path/to/dir1", "path/to/dir2", "-path/to/dir3"],
+                DERIVE_TARGETS_FROM_DIRECTORIES: ["true"],
+            },
+            {
+                "//target:one",
+                "//target:two",
+                "//path/to/dir1/...",
+                "//path/to/dir2/...",
+            },
+            {"//target:three", "//path/to/dir3/..."},
+        ),
+    ]
 
     @patch("os.path.exists")
-    @patch("os.path.join")
     @patch("bsp_server.scip_sync_util.scip_utils.parse_bazelproject")
-    def test_targets_fetched_successfully_with_exclusions_defined_derive_from_dirs_enabled(
-        self, m_parse, m_join, m_exists
-    ):
-        m_exists.return_value = True
-        m_join.return_value = "/path/to/.bazelproject"
-        m_parse.return_value = {
-            TARGETS: ["//target:one", "//target:two", "-//target:three"],
-            DIRECTORIES: [".", "path/to/dir1", "path/to/dir2", "-path/to/dir3"],
-            DERIVE_TARGETS_FROM_DIRECTORIES: ["true"],
-        }
-
-        result, excludes = scip_sync.fetch_targets_from_bazelproject("/mocked/cwd")
-
-        self.assertEqual(
-            sorted(list(result)),
-            sorted(
-                [
-                    "//target:one",
-                    "//target:two",
-                    "//path/to/dir1/...",
-                    "//path/to/dir2/...",
-                ]
-            ),
-        )
-        self.assertEqual(
-            sorted(list(excludes)),
-            sorted(["//target:three", "//path/to/dir3/..."]),
+    def test_fetch_targets_from_bazelproject(self, m_parse, m_exists):
+        bazel_project_file = os.path.join("/mocked/cwd", ".ijwb", ".bazelproject")
+
+        for case, exists, parsed, targets, excludes in self.BAZELPROJECT_CASES:
+            with self.subTest(case=case):
+                m_parse.reset_mock(return_value=True, side_effect=True)
+                m_exists.return_value = exists
+                if isinstance(parsed, Exception):
+                    m_parse.side_effect = parsed
+                else:
+                    m_parse.return_value = parsed
+
+                result, result_excludes = scip_sync.fetch_targets_from_bazelproject(
+                    "/mocked/cwd"
+                )
+
+                self.assertSetEqual(result, targets)
+                self.assertSetEqual(result_excludes, excludes)
+                m_exists.assert_called_with(bazel_project_file)
+                if exists:
+                    m_parse.assert_called_once_with(bazel_project_file)
+                else:
+                    m_parse.assert_not_called()
+
+    # (targets, depth, get_dependency_graph kwargs, expected targets)
+    DEPENDENCY_GRAPH_CASES = [
+        ({"//path/to:target1", "//path/to:target2"}, 1, {}, _DEPTH_ONE),
+        ({"//path/to:target1", "//path/to:target2"}, 2, {}, _ALL_TARGETS),
+        ({"//path/to:target1", "//path/to:target2"}, 0, {}, _EXPORTED_ROOTS),
+        ({"//path/to/..."}, 0, {}, _PATH_TO_PACKAGE),
+        ({"//path/to/..."}, 1, {}, _DEPTH_ONE),
+        ({"//path/..."}, 1, {}, _ALL_TARGETS),
+        ({"//path/..."}, 99, {}, _ALL_TARGETS),
+        ({"//wololo/..."}, 1, {}, frozenset()),
+        (
+            {"//path/to:dep1", "//path/new:dep3"},
+            1,
+            {"query_rdeps": True},
+            frozenset({"//path/to:target1", "//path/other:dep2"}),
+        ),
+        (
+            {"//path/to:dep1", "//path/new:dep3"},
+            1,
+            {"exclude_targets": {"//path/new:dep3"}, "query_rdeps": True},
+            frozenset({"//path/to:target1"}),
+        ),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        cls._dummy_stat_template = scip_sync.SyncStats()
+        cls.GRAPH = MappingProxyType(
+            {
+                "//path/to:target1": {
+                    "exports": ["//path/to:export1"],
+                    "direct_deps": ["//path/to:dep1"],
+                },
+                "//path/to:target2": {
+                    "exports": [],
+                    "direct_deps": ["//path/other:dep2"],
+                },
+                "//path/to:dep1": {"exports": [], "direct_deps": ["//path/other:dep2"]},
+                "//path/other:dep2": {
+                    "exports": [],
+                    "direct_deps": ["//path/new:dep3"],
+                },
+                "//path/new:dep3": {"exports": [], "direct_deps": []},
+                "//path/to:export1": {
+                    "exports": ["//path/to:export2"],
+                    "direct_deps": [],
+                },
+                "//path/to:export2": {
+                    "exports": ["//path/to:export3"],
+                    "direct_deps": [],
+                },
+                "//path/to:export3": {"exports": [], "direct_deps": []},
+            }
         )
-        m_join.assert_called_with("/mocked/cwd", ".ijwb", ".bazelproject")
-        m_exists.assert_called_with("/path/to/.bazelproject")
-        m_parse.assert_called_with("/path/to/.bazelproject")
 
     @patch("bsp_server.scip_sync_util.scip_sync.execute_query")
     @patch("bsp_server.scip_sync_util.scip_utils.transform_bazel_query_results")
     def test_get_dependency_graph_with_multiple_targets(
         self, mock_transform_bazel_query_results, mock_execute_query
     ):
-        mock_execute_query.return_value = MagicMock()
-        mock_transform_bazel_query_results.return_value = {
-            "//path/to:target1": {
-                "exports": ["//path/to:export1"],
-                "direct_deps": ["//path/to:dep1"],
-            },
-            "//path/to:target2": {"exports": [], "direct_deps": ["//path/other:dep2"]},
-            "//path/to:dep1": {"exports": [], "direct_deps": ["//path/other:dep2"]},
-            "//path/other:dep2": {"exports": [], "direct_deps": ["//path/new:dep3"]},
-            "//path/new:dep3": {"exports": [], "direct_deps": []},
-            "//path/to:export1": {"exports": ["//path/to:export2"], "direct_deps": []},
-            "//path/to:export2": {"exports": ["//path/to:export3"], "direct_deps": []},
-            "//path/to:export3": {"exports": [], "direct_deps": []},
-        }
+        mock_execute_query.return_value = object()
+        mock_transform_bazel_query_results.return_value = self.GRAPH
 
-        result = scip_sync.get_dependency_graph(
-            "/path/to/cwd", {"//path/to:target1", "//path/to:target2"}, 1
-        )
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:dep1",
-                "//path/to:target2",
-                "//path/other:dep2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-            },
-        )
-        result = scip_sync.get_dependency_graph(
-            "/path/to/cwd", {"//path/to:target1", "//path/to:target2"}, 2
-        )
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:dep1",
-                "//path/to:target2",
-                "//path/other:dep2",
-                "//path/new:dep3",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-            },
-        )
-        result = scip_sync.get_dependency_graph(
-            "/path/to/cwd", {"//path/to:target1", "//path/to:target2"}, 0
-        )
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:target2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-            },
-        )
-        result = scip_sync.get_dependency_graph("/path/to/cwd", {"//path/to/..."}, 0)
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:target2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-                "//path/to:dep1",
-            },
-        )
-        result = scip_sync.get_dependency_graph("/path/to/cwd", {"//path/to/..."}, 1)
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:target2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-                "//path/to:dep1",
-                "//path/other:dep2",
-            },
-        )
-        result = scip_sync.get_dependency_graph("/path/to/cwd", {"//path/..."}, 1)
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:target2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-                "//path/to:dep1",
-                "//path/other:dep2",
-                "//path/new:dep3",
-            },
-        )
-        result = scip_sync.get_dependency_graph("/path/to/cwd", {"//path/..."}, 99)
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-                "//path/to:target2",
-                "//path/to:export1",
-                "//path/to:export2",
-                "//path/to:export3",
-                "//path/to:dep1",
-                "//path/other:dep2",
-                "//path/new:dep3",
-            },
-        )
-        result = scip_sync.get_dependency_graph("/path/to/cwd", {"//wololo/..."}, 1)
-        self.assertEqual(
-            result,
-            set(),
-        )
-        result = scip_sync.get_dependency_graph(
-            "/path/to/cwd", {"//path/to:dep1", "//path/new:dep3"}, 1, query_rdeps=True
-        )
-        self.assertEqual(
-            result,
-            {"//path/to:target1", "//path/other:dep2"},
-        )
-        result = scip_sync.get_dependency_graph(
-            "/path/to/cwd",
-            {"//path/to:dep1", "//path/new:dep3"},
-            1,
-            exclude_targets={"//path/new:dep3"},
-            query_rdeps=True,
-        )
-        self.assertEqual(
-            result,
-            {
-                "//path/to:target1",
-            },
-        )
+        for targets, depth, kwargs, expected in self.DEPENDENCY_GRAPH_CASES:
+            with self.subTest(targets=sorted(targets), depth=depth, **kwargs):
+                result = scip_sync.get_dependency_graph(
+                    "/path/to/cwd", targets, depth, **kwargs
+                )
+                self.assertEqual(result, expected)
 
     @patch("bsp_server.scip_sync_util.scip_sync.execute_query")
     @patch("bsp_server.scip_sync_util.scip_utils.transform_bazel_query_results")
     def test_get_dependency_graph_forms_correct_query(
         self, mock_transform_bazel_query_results, mock_execute_query
     ):
-        mock_execute_query.return_value = MagicMock()
+        query_result = object()
+        mock_execute_query.return_value = query_result
         mock_transform_bazel_query_results.return_value = {}
         scip_sync.get_dependency_graph(
             cwd="/path/to/cwd",
@@ -796,53 +608,63 @@ class TestScipSync(unittest.TestCase):
             query_rdeps_universe="//universe/...",
             soft_fail=True,
         )
+        mock_transform_bazel_query_results.assert_called_once_with(query_result)
 
-    def test_convert_directories_to_targets(self):
-        directories = ["path/to/dir1", "path/to/dir2", ".", "path/to/dir3/"]
-        targets = scip_sync.convert_directories_to_targets(directories)
-        self.assertEqual(
-            targets, ["//path/to/dir1/...", "//path/to/dir2/...", "//path/to/dir3/..."]
+    def test_dependency_graph_cache(self):
+        targets = {"//target:one", "//target:two"}
+        cache_path = scip_sync.get_dependency_graph_cache_path(
+            self.temp_dir, targets, set(), 1
         )
 
-    @patch("bsp_server.scip_sync_util.incremental.index_file")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_utils.old_copy_index")
-    @patch("bsp_server.scip_sync_util.scip_sync.scip_workspace.get_manifest_for_file")
-    @patch("argparse.ArgumentParser.parse_args")
-    @patch("bsp_server.scip_sync_util.scip_sync.datetime")
-    def test_main_with_filepath_triggers_old_sync(
-        self,
-        mock_datetime,
-        mock_parse_args,
-        mock_get_manifest_for_file,
-        mock_old_copy_index,
-        mock_index_file,
-    ):
-        mock_datetime.now.return_value = self.mock_datetime
-        filepath = f"{self.cwd}/src/main/java/com/example/File.java"
-        mock_parse_args.return_value = argparse.Namespace(
-            cwd=self.cwd,
-            targets=[],
-            filepath=filepath,
-            depth=1,
-        )
-        manifest_tuple = ("manifest1", "src/main/java")
-        mock_get_manifest_for_file.return_value = manifest_tuple
-        mock_index_file.return_value = "generated_index_path"
+        self.assertIsNone(scip_sync.read_dependency_graph_cache(cache_path))
 
-        # Run the function
-        scip_sync.main()
+        utils.write_json(
+            {"//target:one", "//target:dep"},
+            cache_path,
+            default_serializer=utils.set_to_list,
+        )
+        self.assertEqual(
+            scip_sync.read_dependency_graph_cache(cache_path),
+            {"//target:one", "//target:dep"},
+        )
 
-        # Verify
-        mock_get_manifest_for_file.assert_called_once_with(
-            "src/main/java/com/example/File.java",  # Relative path
-            os.path.join(self.cwd, ".scip"),
+        # Query arguments and workspace files are part of the key
+        self.assertNotEqual(
+            cache_path,
+            scip_sync.get_dependency_graph_cache_path(self.temp_dir, targets, set(), 2),
+        )
+        utils.write_string_content("", os.path.join(self.temp_dir, "MODULE.bazel"))
+        self.assertNotEqual(
+            cache_path,
+            scip_sync.get_dependency_graph_cache_path(self.temp_dir, targets, set(), 1),
         )
 
-        mock_index_file.assert_called_once_with(
-            self.cwd, "src/main/java/com/example/File.java", manifest_tuple
+    def test_normalize_targets(self):
+        self.assertEqual(
+            scip_sync.normalize_targets(
+                [
+                    "//path/to/...",
+                    " //path/to/sub:lib ",
+                    "//path/to:lib",
+                    "//path/to/sub/...",
+                    "//path/tools:lib",
+                    "//other:lib",
+                    "//other:lib",
+                    "",
+                ]
+            ),
+            ["//other:lib", "//path/to/...", "//path/tools:lib"],
         )
-        mock_old_copy_index.assert_called_once_with(
-            {"generated_index_path"}, os.path.join(self.cwd, ".scip")
+        self.assertEqual(
+            scip_sync.normalize_targets(["//path/to:lib", "//...", "//other/..."]),
+            ["//..."],
+        )
+
+    def test_convert_directories_to_targets(self):
+        directories = ["path/to/dir1", "path/to/dir2", ".", "path/to/dir3/", " ./ "]
+        targets = scip_sync.convert_directories_to_targets(directories)
+        self.assertEqual(
+            targets, ["//path/to/dir1/...", "//path/to/dir2/...", "//path/to/dir3/..."]
         )
 
 
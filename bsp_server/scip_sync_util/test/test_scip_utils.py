@@ -1,11 +1,13 @@
-import inspect
+import hashlib
 import os
 import tempfile
 import unittest
-from unittest.mock import MagicMock, patch
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, call, patch
 
 from bsp_server.scip_sync_util import scip_utils
 from bsp_server.scip_sync_util.scip_const import WORKSPACE_FILE_NAME
+from bsp_server.util import utils
 
 
 class TestScipUtils(unittest.TestCase):
@@ -20,15 +22,15 @@ class TestScipUtils(unittest.TestCase):
         )
         self.expected_cmd = ["bazel", "query", self.expected_query_string]
 
-    @staticmethod
-    def resource_path(resource_name):
-        resource_root = os.environ.get("RESOURCE_ROOT", "")
-        # https://stackoverflow.com/questions/37546685/get-absolute-path-of-caller-file/37547263#37547263
-        src_file = (inspect.stack()[1])[1]
-        resources_dir = os.path.join(
-            os.path.dirname(os.path.abspath(src_file)), resource_root, "resources"
-        )
-        return os.path.join(resources_dir, resource_name)
+    RESOURCES_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        os.environ.get("RESOURCE_ROOT", ""),
+        "resources",
+    )
+
+    @classmethod
+    def resource_path(cls, resource_name):
+        return os.path.join(cls.RESOURCES_DIR, resource_name)
 
     def test_parse_bazel_project(self):
         actual_data = scip_utils.parse_bazelproject(self.bazel_project_file)
@@ -47,6 +49,42 @@ class TestScipUtils(unittest.TestCase):
 
         self.assertDictEqual(actual_data, expected_data, "parse_bazelproject_mismatch")
 
+    @patch("bsp_server.util.utils.output_bytes")
+    def test_get_mnemonic_output_reuses_build_options(self, mock_output):
+        mock_output.return_value = b'{"actions": []}'
+
+        result = scip_utils.get_mnemonic_output(
+            self.cwd, "scipMutation", ["//path/to:target"]
+        )
+
+        self.assertEqual(result, {})
+        aquery_cmd = mock_output.call_args.kwargs["command"]
+        self.assertEqual(aquery_cmd[:2], ["bazel", "aquery"])
+        for flag in scip_utils.scip_const.JAVA_VERSION_FLAGS:
+            self.assertIn(flag, aquery_cmd)
+        self.assertEqual(aquery_cmd[-1], 'mnemonic("scipMutation", "//path/to:target")')
+
+    @patch("bsp_server.scip_sync_util.scip_utils.MAX_INLINE_QUERY_LENGTH", 10)
+    @patch("bsp_server.util.utils.output_bytes")
+    def test_get_mnemonic_output_long_query_uses_query_file(self, mock_output):
+        query_files = {}
+
+        def read_query_file(command, cwd):
+            query_file = command[command.index("--query_file") + 1]
+            with open(query_file) as f:
+                query_files[query_file] = f.read()
+            return b"{}"
+
+        mock_output.side_effect = read_query_file
+
+        scip_utils.get_mnemonic_output(self.cwd, "scipMutation", ["//path/to:target"])
+
+        self.assertEqual(
+            list(query_files.values()),
+            ['mnemonic("scipMutation", "//path/to:target")'],
+        )
+        self.assertFalse(os.path.exists(next(iter(query_files))))
+
     @patch("bsp_server.util.utils.output")
     def test_get_containing_bazel_target(self, mock_output):
         # Setup mock
@@ -67,7 +105,7 @@ class TestScipUtils(unittest.TestCase):
     def test_get_containing_bazel_target_multiple_query_kinds(self, mock_output):
         # Setup mock
         mock_output.return_value = "//path/to:target"
-        query_kinds = ["java_library", "java_binary"]
+        query_kinds = ["java_library", "java_binary", "java_library"]
         expected_query_string = 'kind("java_library|java_binary", rdeps("//path/to/...", "path/to/src/file.java"))'
         expected_cmd = ["bazel", "query", expected_query_string]
 
@@ -82,26 +120,28 @@ class TestScipUtils(unittest.TestCase):
         # Verify output was called with correct arguments
         mock_output.assert_called_once_with(expected_cmd, cwd=self.cwd)
 
+    @patch("os.utime")
+    @patch("os.stat")
+    @patch("bsp_server.scip_sync_util.scip_utils._load_sha_cache")
     @patch("bsp_server.util.utils.safe_create")
     @patch("bsp_server.scip_sync_util.scip_utils.get_sha256_for_file")
     @patch("os.remove")
-    @patch("shutil.copy")
-    @patch("os.listdir")
-    @patch("os.path.join")
-    @patch("bsp_server.scip_sync_util.scip_utils.get_thread_pool_size")
+    @patch("bsp_server.util.utils.copy_file")
+    @patch("os.scandir")
+    @patch("bsp_server.scip_sync_util.scip_utils.get_io_executor")
     @patch("shutil.rmtree")
-    @patch("os.path.isfile")
     def test_copy_index(
         self,
-        mock_isfile,
         mock_rmtree,
-        mock_thread_pool,
-        mock_join,
-        mock_listdir,
+        mock_io_executor,
+        mock_scandir,
         mock_copy,
         mock_remove,
         mock_get_sha,
         mock_safe_create,
+        mock_load_sha_cache,
+        mock_stat,
+        mock_utime,
     ):
         # Setup test data
         index_to_copy = {
@@ -112,8 +152,8 @@ class TestScipUtils(unittest.TestCase):
         }
         dest = "/path/to/dest"
 
-        mock_thread_pool.return_value = 2
-        mock_listdir.return_value = [
+        mock_io_executor.return_value = ThreadPoolExecutor(max_workers=2)
+        dest_files = [
             "path_to_existing_index.scip",
             "path_to_existing_index.scip.sha256",
             "old_index.scip",
@@ -122,13 +162,17 @@ class TestScipUtils(unittest.TestCase):
             "jdk_temurin_11.scip.sha256",
             WORKSPACE_FILE_NAME,
         ]
-        mock_join.side_effect = lambda *args: "/".join(args)
-
-        # Setup isfile mock to return True for existing files
-        def isfile_side_effect(path):
-            return any(filename in path for filename in mock_listdir.return_value)
-
-        mock_isfile.side_effect = isfile_side_effect
+        dest_entries = []
+        for filename in dest_files:
+            entry = MagicMock()
+            entry.name = filename
+            entry.path = f"{dest}/{filename}"
+            entry.is_dir.return_value = False
+            entry.stat.return_value = MagicMock(st_size=1, st_mtime_ns=1)
+            dest_entries.append(entry)
+        mock_scandir.return_value.__enter__.return_value = iter(dest_entries)
+        # sources were rebuilt since the last copy, their sha files decide
+        mock_stat.return_value = MagicMock(st_size=1, st_mtime_ns=2, st_atime_ns=2)
 
         # Setup SHA returns
         def get_sha_side_effect(file_path):
@@ -141,6 +185,11 @@ class TestScipUtils(unittest.TestCase):
             return "new_sha"
 
         mock_get_sha.side_effect = get_sha_side_effect
+        mock_load_sha_cache.return_value = {
+            "path_to_existing_index.scip": "same_sha",
+            "old_index.scip": "old_sha",
+            "jdk_temurin_11.scip": "jdk_sha",
+        }
 
         # Setup copy to fail for failing_index
         def copy_side_effect(src, dst):
@@ -155,6 +204,9 @@ class TestScipUtils(unittest.TestCase):
         scip_utils.copy_index(index_to_copy, dest)
 
         mock_safe_create.assert_called_once_with(dest, is_dir=True)
+        mock_load_sha_cache.assert_called_once_with(
+            {entry.name: entry for entry in dest_entries}
+        )
         expected_copies = [
             (
                 (
@@ -187,8 +239,12 @@ class TestScipUtils(unittest.TestCase):
         ]
 
         # Verify copy calls - should only be 4 copies (2 new files + their SHA files)
-        # Note: failing_index should not be counted in successful copies
-        self.assertEqual(mock_copy.call_count, 4)
+        # Note: failing_index is new, so it is attempted once and fails
+        successful_copies = [
+            c for c in mock_copy.call_args_list if "failing_index" not in c.args[0]
+        ]
+        self.assertEqual(len(successful_copies), 4)
+        self.assertEqual(mock_copy.call_count, 5)
         mock_copy.assert_has_calls(expected_copies, any_order=True)
 
         expected_removes = [
@@ -207,35 +263,144 @@ class TestScipUtils(unittest.TestCase):
             remove_call = (((file_path,),), {})
             self.assertNotIn(remove_call, mock_remove.call_args_list)
 
+    def test_copy_index_skips_on_mtime(self):
+        source = os.path.join(self.cwd, "bazel-out", "bin", "pkg", "index.scip")
+        utils.write_string_content("scip index", source)
+        utils.write_string_content("sha1\n", source + ".sha256")
+        dest = os.path.join(self.cwd, "dest")
+        dest_index = os.path.join(dest, "pkg_index.scip")
+
+        scip_utils.copy_index({source}, dest)
+        self.assertEqual(os.stat(dest_index).st_mtime_ns, os.stat(source).st_mtime_ns)
+
+        with patch("bsp_server.util.utils.copy_file") as mock_copy, patch.object(
+            scip_utils,
+            "get_sha256_for_file",
+            wraps=scip_utils.get_sha256_for_file,
+        ) as mock_get_sha:
+            # unchanged source, the mtimes match and the sha file is not read
+            scip_utils.copy_index({source}, dest)
+            self.assertNotIn(call(source + ".sha256"), mock_get_sha.call_args_list)
+
+            # touched but same content, the sha files match
+            source_stat = os.stat(source)
+            os.utime(source, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns + 1))
+            scip_utils.copy_index({source}, dest)
+            self.assertIn(call(source + ".sha256"), mock_get_sha.call_args_list)
+
+            mock_copy.assert_not_called()
+        self.assertEqual(os.stat(dest_index).st_mtime_ns, source_stat.st_mtime_ns + 1)
+
     @patch("builtins.open")
-    @patch("shutil.copy")
-    @patch("bsp_server.scip_sync_util.scip_utils.generate_sha256")
-    def test_old_copy_index(self, m_generate_sha256, m_copy, m_open):
-        m_generate_sha256.return_value = "someHashAbc"
+    @patch("bsp_server.util.utils.copy_file")
+    @patch("bsp_server.scip_sync_util.scip_utils.get_sha256_for_file")
+    @patch("bsp_server.scip_sync_util.scip_utils._copy_and_hash")
+    def test_old_copy_index(
+        self, m_copy_and_hash, m_get_sha256_for_file, m_copy, m_open
+    ):
+        m_copy_and_hash.return_value = "someHashAbc"
+        m_get_sha256_for_file.return_value = None
         gen_scip = "/src/execroot/__main__/bazel-out/k8-fastbuild/bin/some_path/some_index.scip"
-        index_to_copy = [gen_scip]
+        other_scip = (
+            "/src/execroot/__main__/bazel-out/k8-fastbuild/bin/other/index.scip"
+        )
+        index_to_copy = [gen_scip, other_scip]
+        dest = os.path.join(self.cwd, "dest")
 
-        scip_utils.old_copy_index(index_to_copy, os.path.join(self.cwd, "dest"))
+        scip_utils.old_copy_index(index_to_copy, dest)
 
+        m_copy.assert_not_called()
+        self.assertCountEqual(
+            m_copy_and_hash.call_args_list,
+            [
+                call(gen_scip, os.path.join(dest, "some_path_some_index.scip")),
+                call(other_scip, os.path.join(dest, "other_index.scip")),
+            ],
+        )
+        self.assertCountEqual(
+            m_open.call_args_list,
+            [
+                call(os.path.join(dest, "some_path_some_index.scip.sha256"), "w"),
+                call(os.path.join(dest, "other_index.scip.sha256"), "w"),
+            ],
+        )
+        self.assertCountEqual(
+            m_get_sha256_for_file.call_args_list,
+            [call(gen_scip + ".sha256"), call(other_scip + ".sha256")],
+        )
+        m_open.return_value.__enter__.return_value.write.assert_has_calls(
+            [call("someHashAbc\n")] * 2
+        )
+
+    @patch("builtins.open")
+    @patch("bsp_server.util.utils.copy_file")
+    @patch("bsp_server.scip_sync_util.scip_utils.get_sha256_for_file")
+    @patch("bsp_server.scip_sync_util.scip_utils._copy_and_hash")
+    def test_old_copy_index_reuses_sha256_file(
+        self, m_copy_and_hash, m_get_sha256_for_file, m_copy, m_open
+    ):
+        m_get_sha256_for_file.return_value = "bazelHashAbc"
+        gen_scip = "/src/execroot/__main__/bazel-out/k8-fastbuild/bin/some_path/some_index.scip"
+
+        scip_utils.old_copy_index([gen_scip], os.path.join(self.cwd, "dest"))
+
+        m_copy_and_hash.assert_not_called()
         m_copy.assert_called_once_with(
-            gen_scip,
-            os.path.join(self.cwd, "dest", "some_path_some_index.scip"),
+            gen_scip, os.path.join(self.cwd, "dest", "some_path_some_index.scip")
         )
-        m_open.assert_called_once_with(
-            os.path.join(self.cwd, "dest", "some_path_some_index.scip.sha256"),
-            "w",
+        m_open.return_value.__enter__.return_value.write.assert_called_once_with(
+            "bazelHashAbc\n"
         )
-        m_generate_sha256.assert_called_once_with(gen_scip)
 
     @patch("builtins.open")
     def test_get_sha256_for_file_success(self, mock_open):
         mock_file = mock_open.return_value.__enter__.return_value
-        mock_file.read.return_value = "abc123def456  \n"
+        mock_file.read.return_value = b"abc123def456  \n"
 
         result = scip_utils.get_sha256_for_file("/path/to/file.sha256")
 
         self.assertEqual(result, "abc123def456")
-        mock_open.assert_called_once_with("/path/to/file.sha256", "r")
+        mock_open.assert_called_once_with("/path/to/file.sha256", "rb")
+
+    def test_load_sha_cache(self):
+        for filename, content in [
+            ("a.scip", "index"),
+            ("a.scip.sha256", "shaA\n"),
+            ("b.scip", "index"),
+            ("b.scip.sha256", ""),
+            ("orphan.scip.sha256", "shaOrphan\n"),
+            ("c.scip", "index"),
+        ]:
+            utils.write_string_content(content, os.path.join(self.cwd, filename))
+
+        with os.scandir(self.cwd) as it:
+            dest_entries = {entry.name: entry for entry in it}
+
+        self.assertEqual(scip_utils._load_sha_cache(dest_entries), {"a.scip": "shaA"})
+
+    @patch("bsp_server.scip_sync_util.scip_utils.COPY_CHUNK_SIZE", 4)
+    def test_copy_and_hash(self):
+        src = os.path.join(self.cwd, "index.scip")
+        dst = os.path.join(self.cwd, "copy.scip")
+        with open(src, "wb") as f:
+            f.write(b"scip index")
+
+        self.assertEqual(
+            scip_utils._copy_and_hash(src, dst),
+            hashlib.sha256(b"scip index").hexdigest(),
+        )
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), b"scip index")
+
+    def test_generate_sha256(self):
+        file_path = os.path.join(self.cwd, "index.scip")
+        with open(file_path, "wb") as f:
+            f.write(b"scip index")
+
+        self.assertEqual(
+            scip_utils.generate_sha256(file_path),
+            hashlib.sha256(b"scip index").hexdigest(),
+        )
 
     @patch("builtins.open")
     def test_get_sha256_for_file_file_not_found(self, mock_open):
@@ -244,7 +409,44 @@ class TestScipUtils(unittest.TestCase):
         result = scip_utils.get_sha256_for_file("/path/to/nonexistent.sha256")
 
         self.assertIsNone(result)
-        mock_open.assert_called_once_with("/path/to/nonexistent.sha256", "r")
+        mock_open.assert_called_once_with("/path/to/nonexistent.sha256", "rb")
+
+    def test_get_all_outputs(self):
+        action_graph = {
+            "pathFragments": [
+                {"id": 1, "label": "bazel-out"},
+                {"id": 2, "label": "bin", "parentId": 1},
+                {"id": 3, "label": "lib.scip", "parentId": 2},
+                {"id": 4, "label": "lib_sources.txt", "parentId": 2},
+            ],
+            "artifacts": [
+                {"id": 10, "pathFragmentId": 3},
+                {"id": 11, "pathFragmentId": 4},
+            ],
+            "actions": [
+                {"targetId": 1, "mnemonic": "scipMutation", "outputIds": [10]},
+                {
+                    "targetId": 1,
+                    "mnemonic": "scipFindUnpackedJavaSources",
+                    "outputIds": [11, 12],
+                },
+                {"targetId": 2, "mnemonic": "scipMutation", "outputIds": [12]},
+            ],
+            "targets": [
+                {"id": 1, "label": "//path/to:lib"},
+                {"id": 2, "label": "//path/to:empty"},
+            ],
+        }
+
+        self.assertEqual(
+            scip_utils._get_all_outputs(action_graph),
+            {
+                "//path/to:lib": {
+                    "scipMutation": ["bazel-out/bin/lib.scip"],
+                    "scipFindUnpackedJavaSources": ["bazel-out/bin/lib_sources.txt"],
+                }
+            },
+        )
 
     def test_transform_bazel_query_results_with_empty_query_result(self):
         qr = []
@@ -317,6 +519,88 @@ class TestScipUtils(unittest.TestCase):
         }
         self.assertEqual(result, expected)
 
+    def test_filter_list_by_regex(self):
+        items = {"//path/to:target", "//path/to/sub:target", "//other:target"}
+        masks = {"^//path/to:target$", "^//other"}
+
+        self.assertEqual(
+            scip_utils.filter_list_by_regex(items, masks),
+            {"//path/to:target", "//other:target"},
+        )
+        self.assertEqual(
+            scip_utils.filter_list_by_regex(items, scip_utils.compile_regex_set(masks)),
+            {"//path/to:target", "//other:target"},
+        )
+        self.assertEqual(scip_utils.filter_list_by_regex(items, set()), set())
+        self.assertIsNone(scip_utils.compile_regex_set(set()))
+
+    def test_collect_dependencies(self):
+        dep_graph = {
+            "//a:a": {"exports": ["//a:export"], "direct_deps": ["//b:b"]},
+            "//a:export": {"exports": [], "direct_deps": ["//c:c"]},
+            "//b:b": {"exports": [], "direct_deps": ["//c:c"]},
+            "//c:c": {"exports": [], "direct_deps": ["//d:d"]},
+            "//d:d": {"exports": [], "direct_deps": []},
+        }
+        targets = ["//a:a", "//b:b"]
+        expected = {
+            -1: {"//a:export"},
+            0: {"//a:a", "//a:export", "//b:b"},
+            1: {"//a:a", "//a:export", "//b:b", "//c:c"},
+            2: {"//a:a", "//a:export", "//b:b", "//c:c", "//d:d"},
+        }
+
+        for depth, deps in expected.items():
+            with self.subTest(depth=depth):
+                self.assertEqual(
+                    scip_utils.collect_dependencies(dep_graph, targets, depth), deps
+                )
+
+    def test_collect_dependencies_with_export_cycle(self):
+        dep_graph = {
+            "//a:a": {"direct_deps": ["//c:c"], "exports": ["//b:b"]},
+            "//b:b": {"direct_deps": [], "exports": ["//a:a"]},
+            "//c:c": {"direct_deps": [], "exports": []},
+        }
+
+        self.assertEqual(
+            scip_utils.collect_dependencies(dep_graph, ["//a:a"], 1),
+            {"//a:a", "//b:b", "//c:c"},
+        )
+        self.assertEqual(
+            scip_utils.collect_dependencies(dep_graph, ["//a:a"], -1),
+            {"//a:a", "//b:b"},
+        )
+
+    def test_filter_existing_paths(self):
+        sub_dir = os.path.join(self.cwd, "sub")
+        os.makedirs(sub_dir)
+        for path in [
+            os.path.join(self.cwd, "index1.scip"),
+            os.path.join(self.cwd, "index2.scip"),
+            os.path.join(sub_dir, "index3.scip"),
+        ]:
+            with open(path, "w") as f:
+                f.write("")
+
+        paths = [
+            os.path.join(self.cwd, "index1.scip"),
+            os.path.join(self.cwd, "index2.scip"),
+            os.path.join(self.cwd, "missing.scip"),
+            os.path.join(sub_dir, "index3.scip"),
+            os.path.join(self.cwd, "missing_dir", "index4.scip"),
+            os.path.join(self.cwd, "missing_dir", "index5.scip"),
+        ]
+
+        self.assertEqual(
+            scip_utils.filter_existing_paths(paths),
+            {
+                os.path.join(self.cwd, "index1.scip"),
+                os.path.join(self.cwd, "index2.scip"),
+                os.path.join(sub_dir, "index3.scip"),
+            },
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,6 +2,7 @@ import os
 import tempfile
 import unittest
 from dataclasses import asdict
+from types import MappingProxyType
 from typing import Tuple
 from unittest.mock import MagicMock, mock_open, patch
 
@@ -10,15 +11,26 @@ from bsp_server.scip_sync_util.workspace import (
     ScipMnemonics,
     ScipWorkspace,
     WorkspaceLinkType,
+    add_files_for_target,
     add_to_workspace,
     create_workspace,
     get_manifest_for_file,
     populate_workspace,
+    workspace_to_dictionary,
     write_workspace,
 )
 
 
 class ScipWorkspaceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.MANIFEST1_WORKSPACE = MappingProxyType(
+            {
+                "files": {"file1.java": {"JAVA_MANIFEST": "1"}},
+                "links": {"JAVA_MANIFEST": {"1": "manifest1"}},
+            }
+        )
+
     def setUp(self):
         self.temp_dir = tempfile.mkdtemp()
         self.cwd = "path/to/cwd"
@@ -74,23 +86,14 @@ class ScipWorkspaceTest(unittest.TestCase):
         manifest = workspace.get_link("1", WorkspaceLinkType.JAVA_MANIFEST)
         self.assertIsNone(manifest)
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
     @patch("bsp_server.util.utils.get_json")
-    def test_get_manifest_for_existing_file(self, mock_get_json, mock_path_exists):
-        mock_path_exists.return_value = True
-        mock_get_json.return_value = {
-            "files": {"file1.java": {"JAVA_MANIFEST": "1"}},
-            "links": {"JAVA_MANIFEST": {"1": "manifest1"}},
-        }
+    def test_get_manifest_for_existing_file(self, mock_get_json):
+        mock_get_json.return_value = self.MANIFEST1_WORKSPACE
         manifest = get_manifest_for_file("file1.java", "/path/to/dest")
         self.assertEqual(manifest, "manifest1")
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
     @patch("bsp_server.util.utils.get_json")
-    def test_get_manifest_for_existing_file_with_roots(
-        self, mock_get_json, mock_path_exists
-    ):
-        mock_path_exists.return_value = True
+    def test_get_manifest_for_existing_file_with_roots(self, mock_get_json):
         mock_get_json.return_value = {
             "files": {
                 "file1.java": {
@@ -119,21 +122,57 @@ class ScipWorkspaceTest(unittest.TestCase):
             "bazel-out/k8-fastbuild/bin/experimental/users/hshukla/scip/java-sample/experimental/users/hshukla/scip/java-sample:src_main_manifest.jar",
         )
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
     @patch("bsp_server.util.utils.get_json")
-    def test_get_manifest_for_non_existing_file(self, mock_get_json, mock_path_exists):
-        mock_path_exists.return_value = True
-        mock_get_json.return_value = {
-            "files": {"file1.java": {"JAVA_MANIFEST": "1"}},
-            "links": {"JAVA_MANIFEST": {"1": "manifest1"}},
-        }
+    def test_get_manifest_for_non_existing_file(self, mock_get_json):
+        mock_get_json.return_value = self.MANIFEST1_WORKSPACE
         manifest = get_manifest_for_file("file2.java", "/path/to/dest")
         self.assertIsNone(manifest)
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
+    def test_add_files_for_target_shared_file(self):
+        workspace = ScipWorkspace()
+        add_files_for_target(workspace, "//a", ["a.java", "shared.java"], "m1")
+        add_files_for_target(workspace, "//b", ["shared.java"], "m2")
+
+        self.assertEqual(
+            workspace.get_file("a.java"), {"BAZEL_TARGET": "1", "JAVA_MANIFEST": "2"}
+        )
+        # the last target wins, as with add_file
+        self.assertEqual(
+            workspace.get_file("shared.java"),
+            {"BAZEL_TARGET": "3", "JAVA_MANIFEST": "4"},
+        )
+
+    def test_workspace_to_dictionary(self):
+        workspace = ScipWorkspace()
+        target_id = workspace.add_link("//target:one", WorkspaceLinkType.BAZEL_TARGET)
+        manifest_id = workspace.add_link("manifest1", WorkspaceLinkType.JAVA_MANIFEST)
+        workspace.add_file("file1.java", target_id, WorkspaceLinkType.BAZEL_TARGET)
+        workspace.add_file("file1.java", manifest_id, WorkspaceLinkType.JAVA_MANIFEST)
+        workspace.add_file("file2.java", target_id, WorkspaceLinkType.BAZEL_TARGET)
+        # files without a target are dropped
+        workspace.add_file("file3.java", manifest_id, WorkspaceLinkType.JAVA_MANIFEST)
+
+        self.assertEqual(
+            workspace_to_dictionary(workspace),
+            {
+                "//target:one": {
+                    ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: {
+                        "file1.java",
+                        "file2.java",
+                    },
+                    ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: "manifest1",
+                }
+            },
+        )
+
+    @patch("bsp_server.util.utils.get_json")
+    def test_get_manifest_for_file_no_workspace(self, mock_get_json):
+        mock_get_json.side_effect = FileNotFoundError()
+
+        self.assertIsNone(get_manifest_for_file("file1.java", "/dest"))
+
     @patch("bsp_server.util.utils.get_string_lines")
-    def test_add_to_workspace(self, mock_get_string_lines, mock_path_exists):
-        mock_path_exists.return_value = True
+    def test_add_to_workspace(self, mock_get_string_lines):
         mock_get_string_lines.return_value = ["file1.java", "file2.java"]
 
         workspace = ScipWorkspace()
@@ -161,12 +200,12 @@ class ScipWorkspaceTest(unittest.TestCase):
         )
         mock_get_string_lines.assert_called_once_with("/cwd/sources_list.txt")
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
+    @patch("bsp_server.util.utils.get_string_lines")
     @patch("bsp_server.scip_sync_util.workspace.add_files_for_target")
     def test_add_to_workspace_no_sources_list(
-        self, mock_add_files_for_target, mock_path_exists
+        self, mock_add_files_for_target, mock_get_string_lines
     ):
-        mock_path_exists.return_value = False
+        mock_get_string_lines.side_effect = FileNotFoundError()
 
         workspace = ScipWorkspace()
         target_mnemonics = {
@@ -181,13 +220,11 @@ class ScipWorkspaceTest(unittest.TestCase):
         self.assertEqual(workspace._last_link_id, 0)
         mock_add_files_for_target.assert_not_called()
 
-    @patch("bsp_server.scip_sync_util.workspace.os.path.exists")
+    @patch("bsp_server.util.utils.get_string_lines")
     @patch("bsp_server.scip_sync_util.workspace.add_files_for_target")
     def test_add_to_workspace_none_sources_list(
-        self, mock_add_files_for_target, mock_path_exists
+        self, mock_add_files_for_target, mock_get_string_lines
     ):
-        mock_path_exists.return_value = False
-
         workspace = ScipWorkspace()
         target_mnemonics = {
             ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: ["manifest1"],
@@ -200,6 +237,7 @@ class ScipWorkspaceTest(unittest.TestCase):
         self.assertEqual(workspace.links, {})
         self.assertEqual(workspace._last_link_id, 0)
         mock_add_files_for_target.assert_not_called()
+        mock_get_string_lines.assert_not_called()
 
     @patch("bsp_server.util.utils.safe_create")
     @patch("bsp_server.util.utils.write_json")
@@ -274,12 +312,14 @@ class ScipWorkspaceTest(unittest.TestCase):
                 mock_workspace,
                 "//src/main/java/com/example:target1",
                 target_to_output["//src/main/java/com/example:target1"],
+                [],
             ),
             unittest.mock.call(
                 self.cwd,
                 mock_workspace,
                 "//src/main/java/com/example:target2",
                 target_to_output["//src/main/java/com/example:target2"],
+                [],
             ),
         ]
         mock_add_to_workspace.assert_has_calls(calls, any_order=True)
@@ -320,11 +360,45 @@ class ScipWorkspaceTest(unittest.TestCase):
         self.assertEqual(result, mock_workspace)
 
         # Verify add_to_workspace was called only for the non-3rdparty target
+        # manifests without the "_options" suffix contribute no sources
         mock_add_to_workspace.assert_called_once_with(
             self.cwd,
             mock_workspace,
             "//src/main/java/com/example:target1",
             target_to_output["//src/main/java/com/example:target1"],
+            [],
+        )
+
+    def test_populate_workspace_reads_sources(self):
+        target_to_output = {
+            f"//src:target{i}": {
+                ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value: [
+                    f"manifest{i}_options"
+                ],
+                ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value: [source_list],
+            }
+            for i, source_list in enumerate(
+                [self.source_list_path, self.another_source_list_path]
+            )
+        }
+
+        workspace = populate_workspace(self.cwd, target_to_output)
+
+        # links are numbered in target order regardless of read completion order
+        self.assertEqual(
+            workspace.links,
+            {
+                "BAZEL_TARGET": {"1": "//src:target0", "3": "//src:target1"},
+                "JAVA_MANIFEST": {"2": "manifest0_options", "4": "manifest1_options"},
+            },
+        )
+        self.assertEqual(
+            sorted(workspace.files),
+            ["file1.java", "file2.java", "file3.java", "file4.java"],
+        )
+        self.assertEqual(
+            workspace.get_file("file3.java"),
+            {"BAZEL_TARGET": "3", "JAVA_MANIFEST": "4"},
         )
 
     @patch("bsp_server.scip_sync_util.workspace.add_to_workspace")
@@ -390,13 +464,11 @@ class ScipWorkspaceTest(unittest.TestCase):
 
     @patch("bsp_server.scip_sync_util.workspace.add_files_for_target")
     @patch("bsp_server.util.utils.get_string_lines")
-    @patch("os.path.exists")
     def test_add_to_workspace_integration(
-        self, mock_exists, mock_get_string_lines, mock_add_files_for_target
+        self, mock_get_string_lines, mock_add_files_for_target
     ):
         """Test the integration between populate_workspace and add_to_workspace"""
         # Setup
-        mock_exists.return_value = True
         # Set up get_string_lines to return different values for different calls
         mock_get_string_lines.side_effect = [
             ["file1.java", "file2.java"],
@@ -432,17 +504,6 @@ class ScipWorkspaceTest(unittest.TestCase):
             target_to_output["//src/main/java/com/example:target1"],
         )
 
-        # Verify
-        mock_exists.assert_has_calls(
-            [
-                unittest.mock.call(os.path.join(self.cwd, self.source_list_path)),
-                unittest.mock.call(
-                    os.path.join(self.cwd, self.another_source_list_path)
-                ),
-            ],
-            any_order=True,
-        )
-
         # Verify get_string_lines was called twice with the correct arguments
         expected_calls = [
             unittest.mock.call(os.path.join(self.cwd, self.source_list_path)),
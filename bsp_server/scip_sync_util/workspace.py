@@ -1,12 +1,16 @@
 import os
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Union
+from types import MappingProxyType
+from typing import Mapping, Optional, Union
 
+from bsp_server.scip_sync_util import scip_utils
 from bsp_server.scip_sync_util.mnemonics import ScipMnemonics
 from bsp_server.util import utils
 
 WORKSPACE_FILE_NAME = "workspace.json"
+# Targets that are not part of the workspace (3rd party and generated)
+SKIPPED_TARGET_PREFIXES = ("//3rdparty/", "bazel-out")
 
 
 class WorkspaceLinkType(Enum):
@@ -14,6 +18,13 @@ class WorkspaceLinkType(Enum):
     BAZEL_TARGET = "2"
 
 
+# Link type keys as stored in workspace.json, resolved once for the hot loops
+_JAVA_MANIFEST = WorkspaceLinkType.JAVA_MANIFEST.name
+_BAZEL_TARGET = WorkspaceLinkType.BAZEL_TARGET.name
+# Shared read-only fallback for link types that have no entries yet
+_NO_LINKS: Mapping[str, str] = MappingProxyType({})
+
+
 @dataclass
 class ScipWorkspace:
     # Single file could be related to multiple artifacts. To avoid duplication
@@ -26,9 +37,7 @@ class ScipWorkspace:
     _last_link_id: int = 0
 
     def add_file(self, file: str, link_id: int, link_type: WorkspaceLinkType) -> None:
-        if file not in self.files:
-            self.files[file] = {}
-        self.files[file].update({link_type.name: str(link_id)})
+        self.files.setdefault(file, {})[link_type.name] = str(link_id)
 
     def get_file(self, file: str):
         return self.files.get(file, None)
@@ -37,13 +46,11 @@ class ScipWorkspace:
         self._last_link_id += 1
         # use str since parsing json will convert int to string
         id = str(self._last_link_id)
-        type_links = self.links.get(link_type.name, {})
-        type_links.update({id: link})
-        self.links[link_type.name] = type_links
+        self.links.setdefault(link_type.name, {})[id] = link
         return id
 
     def get_link(self, link_id: str, link_type: WorkspaceLinkType):
-        return self.links.get(link_type.name, {}).get(link_id, None)
+        return self.links.get(link_type.name, _NO_LINKS).get(link_id, None)
 
     def clear(self):
         self.files = {}
@@ -55,22 +62,29 @@ def workspace_to_dictionary(
     workspace: ScipWorkspace,
 ) -> dict[str, dict[str, dict[str, str]]]:
     workspace_dict = {}
-    for file in workspace.files:
-        target = None
-        manifest = None
-        for link_type, link_id in workspace.files[file].items():
-            if link_type == WorkspaceLinkType.BAZEL_TARGET.name:
-                target = workspace.get_link(link_id, WorkspaceLinkType.BAZEL_TARGET)
-            if link_type == WorkspaceLinkType.JAVA_MANIFEST.name:
-                manifest = workspace.get_link(link_id, WorkspaceLinkType.JAVA_MANIFEST)
-        if target:
-            workspace_dict.setdefault(target, {}).setdefault(
-                ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value, set()
-            ).add(file)
-            if manifest:
-                workspace_dict.setdefault(target, {}).setdefault(
-                    ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value, manifest
-                )
+    targets = workspace.links.get(_BAZEL_TARGET, {})
+    manifests = workspace.links.get(_JAVA_MANIFEST, {})
+    # Group files by their (target, manifest) link ids first, files of a target
+    # share the same ids so the output is built once per group, not per file.
+    # Groups keep first-seen order, so the first manifest of a target still wins.
+    files_by_links: dict[tuple, list[str]] = {}
+    for file, file_links in workspace.files.items():
+        link_ids = (file_links.get(_BAZEL_TARGET), file_links.get(_JAVA_MANIFEST))
+        files_by_links.setdefault(link_ids, []).append(file)
+
+    for (target_id, manifest_id), files in files_by_links.items():
+        target = targets.get(target_id)
+        if not target:
+            continue
+        target_dict = workspace_dict.setdefault(target, {})
+        target_dict.setdefault(
+            ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value, set()
+        ).update(files)
+        manifest = manifests.get(manifest_id)
+        if manifest:
+            target_dict.setdefault(
+                ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value, manifest
+            )
     return workspace_dict
 
 
@@ -82,11 +96,19 @@ def populate_workspace(
     cwd: str, target_to_output: dict[str, dict[str, list[str]]]
 ) -> ScipWorkspace:
     workspace = create_workspace(cwd)
-    for target, target_mnemonics in target_to_output.items():
-        # Skip 3rd party targets for workspace
-        if target.startswith("//3rdparty/") or target.startswith("bazel-out"):
-            continue
-        add_to_workspace(cwd, workspace, target, target_mnemonics)
+    # Skip 3rd party targets for workspace
+    targets = [
+        (target, target_mnemonics)
+        for target, target_mnemonics in target_to_output.items()
+        if not target.startswith(SKIPPED_TARGET_PREFIXES)
+    ]
+    # Reading sources lists is independent per target, overlap it on the io pool.
+    # map keeps the input order, so link ids are assigned as in a serial run.
+    target_sources = scip_utils.get_io_executor().map(
+        lambda entry: read_target_sources(cwd, entry[1]), targets
+    )
+    for (target, target_mnemonics), sources in zip(targets, target_sources):
+        add_to_workspace(cwd, workspace, target, target_mnemonics, sources)
     return workspace
 
 
@@ -95,7 +117,23 @@ def add_to_workspace(
     workspace: ScipWorkspace,
     target: str,
     target_mnemonics: dict[str, list[str]],
+    sources: Optional[list[tuple[str, list[str]]]] = None,
 ) -> None:
+    if sources is None:
+        sources = read_target_sources(cwd, target_mnemonics)
+    for manifest, lines in sources:
+        add_files_for_target(
+            workspace=workspace,
+            target=target,
+            files=lines,
+            manifest=manifest,
+        )
+
+
+def read_target_sources(
+    cwd: str, target_mnemonics: dict[str, list[str]]
+) -> list[tuple[str, list[str]]]:
+    """Read the (manifest, source files) pairs of a target, safe to run in a pool."""
     manifests = target_mnemonics.get(
         ScipMnemonics.JAVA_TARGET_MANIFEST_MNEMONIC.value, [None]
     )
@@ -105,6 +143,7 @@ def add_to_workspace(
     sources_lists = target_mnemonics.get(
         ScipMnemonics.UNPACKED_JAVA_SOURCES_MNEMONIC.value, [None]
     )
+    sources = []
     for index, manifest in enumerate(manifests):
         # for given target we can have only 1 manifest and 1 sources list
         if index >= len(sources_lists):
@@ -113,14 +152,12 @@ def add_to_workspace(
         sources_list = sources_lists[index]
         if sources_list is None:
             continue
-        if os.path.exists(os.path.join(cwd, sources_list)):
+        try:
             lines = utils.get_string_lines(os.path.join(cwd, sources_list))
-            add_files_for_target(
-                workspace=workspace,
-                target=target,
-                files=lines,
-                manifest=manifest,
-            )
+        except FileNotFoundError:
+            continue
+        sources.append((manifest, lines))
+    return sources
 
 
 def add_files_for_target(
@@ -128,14 +165,25 @@ def add_files_for_target(
 ) -> None:
     target_id = workspace.add_link(target, WorkspaceLinkType.BAZEL_TARGET)
     manifest_id = workspace.add_link(manifest, WorkspaceLinkType.JAVA_MANIFEST)
+    # Same result as add_file for both link types, with one lookup per file
+    file_links = {_BAZEL_TARGET: str(target_id), _JAVA_MANIFEST: str(manifest_id)}
+    workspace_files = workspace.files
     for file in files:
-        workspace.add_file(file, target_id, WorkspaceLinkType.BAZEL_TARGET)
-        workspace.add_file(file, manifest_id, WorkspaceLinkType.JAVA_MANIFEST)
+        entry = workspace_files.get(file)
+        if entry is None:
+            workspace_files[file] = file_links.copy()
+        else:
+            entry.update(file_links)
 
 
 def write_workspace(workspace: ScipWorkspace, dest: str) -> None:
     utils.safe_create(dest, is_dir=True)
-    workspace_dict = asdict(workspace)
+    # Fields are already plain JSON-shaped dicts, so skip asdict()'s deep copy
+    workspace_dict = {
+        "files": workspace.files,
+        "links": workspace.links,
+        "_last_link_id": workspace._last_link_id,
+    }
     utils.write_json(
         workspace_dict,
         os.path.join(dest, WORKSPACE_FILE_NAME),
@@ -145,13 +193,10 @@ def write_workspace(workspace: ScipWorkspace, dest: str) -> None:
 
 
 def get_manifest_for_file(file: str, dest: str) -> Union[str, None]:
-    if os.path.exists(os.path.join(dest, WORKSPACE_FILE_NAME)):
+    try:
         json_obj = utils.get_json(os.path.join(dest, WORKSPACE_FILE_NAME))
-        workspace = ScipWorkspace(**json_obj)
-        # update workspace with new data
-        file_links = workspace.get_file(file)
-        if file_links:
-            manifest_link = file_links.get(WorkspaceLinkType.JAVA_MANIFEST.name, None)
-            # we are expecting only 1 manifest for a file
-            return workspace.get_link(manifest_link, WorkspaceLinkType.JAVA_MANIFEST)
-    return None
+    except FileNotFoundError:
+        return None
+    manifest_link = json_obj.get("files", {}).get(file, {}).get(_JAVA_MANIFEST)
+    # we are expecting only 1 manifest for a file
+    return json_obj.get("links", {}).get(_JAVA_MANIFEST, {}).get(manifest_link)
@@ -1,9 +1,15 @@
+import fcntl
 import json
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
-from functools import partial
+
+# Read buffer for streamed command output
+STREAM_BUFFER_SIZE = 1 << 20
+# Linux ioctl to share the data blocks of one file with another (reflink)
+FICLONE = 0x40049409
 
 
 def output(command, cwd, stderr=None, env_vars=None) -> str:
@@ -17,6 +23,17 @@ def output(command, cwd, stderr=None, env_vars=None) -> str:
     return output_string.decode("utf-8").strip()
 
 
+def output_bytes(command, cwd, stderr=None, env_vars=None) -> bytes:
+    """Raw command output, for large payloads that are parsed without decoding."""
+    return _invoke(
+        func=subprocess.check_output,
+        command=command,
+        cwd=cwd,
+        stderr=stderr,
+        env_vars=env_vars,
+    )
+
+
 def check(command, cwd, stderr=None, env_vars=None):
     _invoke(
         func=subprocess.check_call,
@@ -28,18 +45,22 @@ def check(command, cwd, stderr=None, env_vars=None):
 
 
 def safe_create(file_path, is_dir=False):
-    if not os.path.exists(file_path):
-        if is_dir:
-            os.makedirs(file_path)
-            return
-        parent = os.path.dirname(file_path)
-        if not os.path.exists(parent):
-            os.makedirs(parent)
-
-
-def _invoke(func, command, cwd, stdout=None, stderr=None, env_vars=None, text=False):
-    call = partial(func, command, cwd=cwd)
-
+    # exist_ok makes this a single mkdir attempt, without the exists() race
+    directory = file_path if is_dir else os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+def _invoke(
+    func,
+    command,
+    cwd,
+    stdout=None,
+    stderr=None,
+    env_vars=None,
+    text=False,
+    bufsize=None,
+):
     args = {}
     if stderr:
         args["stderr"] = stderr
@@ -50,27 +71,24 @@ def _invoke(func, command, cwd, stdout=None, stderr=None, env_vars=None, text=Fa
     if text:
         args["text"] = True
 
-    env = os.environ.copy()
-    env["PROJECT_ROOT"] = cwd
-    if env_vars:
-        env.update(env_vars)
+    if bufsize:
+        args["bufsize"] = bufsize
 
-    args["env"] = env
+    # Children always see PROJECT_ROOT, so the environment is built in one pass
+    args["env"] = {**os.environ, "PROJECT_ROOT": cwd, **(env_vars or {})}
 
-    return call(**args)
+    return func(command, cwd=cwd, **args)
 
 
 def get_string_lines(file_path):
     # We don't use str.splitlines() here since it also
     # splits at 0x85 which is not desirable
     # https://docs.python.org/3/library/stdtypes.html#str.splitlines
-    lines = get_string_content(file_path).split("\n")
-    normalized_lines = []
-    for line in lines:
-        line = line.strip()
-        if line:
-            normalized_lines.append(line)
-    return normalized_lines
+    return [
+        line
+        for raw_line in get_string_content(file_path).split("\n")
+        if (line := raw_line.strip())
+    ]
 
 
 def get_string_content(file_path):
@@ -80,8 +98,9 @@ def get_string_content(file_path):
 
 
 def get_json(file_path):
-    with open(file_path, "r") as f:
-        return json.load(f)
+    # json.loads accepts bytes, read once instead of streaming through a text decoder
+    with open(file_path, "rb") as f:
+        return json.loads(f.read())
 
 
 def set_to_list(obj):
@@ -97,26 +116,19 @@ def write_json(
     newline_eof=False,
     sort_keys=False,
 ):
+    # Serialize in memory and write once, json.dump issues a write per token
+    content = json.dumps(
+        json_content,
+        indent=2 if pretty else None,
+        default=default_serializer,
+        sort_keys=sort_keys,
+    )
     safe_create(json_path)
-    with open(json_path, "w") as json_file:
-        if pretty:
-            json.dump(
-                json_content,
-                json_file,
-                indent=2,
-                default=default_serializer,
-                sort_keys=sort_keys,
-            )
-        else:
-            json.dump(
-                json_content,
-                json_file,
-                default=default_serializer,
-                sort_keys=sort_keys,
-            )
-
+    # json.dumps escapes non-ASCII by default, so encoding is a plain byte copy
+    with open(json_path, "wb") as json_file:
+        json_file.write(content.encode("ascii"))
         if newline_eof:
-            json_file.write("\n")
+            json_file.write(b"\n")
 
 
 def write_list(content, file_path, append=False):
@@ -139,6 +151,55 @@ def write_string_content(content, file_path, append=False):
         f_stream.write(content)
 
 
+def copy_file(src, dst):
+    """
+    Copy the contents of src to dst, like shutil.copyfile the mode is not
+    copied. On Linux the data is cloned when the filesystem supports reflinks,
+    or copied within the kernel otherwise.
+    """
+    if sys.platform == "linux":
+        try:
+            _copy_file_in_kernel(src, dst)
+        except OSError:
+            # e.g. unsupported by the filesystem or across mounts on older kernels
+            shutil.copyfile(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def _copy_file_in_kernel(src, dst):
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            return
+        except OSError:
+            pass
+
+        size = os.fstat(src_file.fileno()).st_size
+        offset = 0
+        try:
+            while offset < size:
+                copied = os.copy_file_range(
+                    src_file.fileno(), dst_file.fileno(), size - offset
+                )
+                if copied == 0:
+                    # the source ended early, never leave a truncated copy behind
+                    raise OSError(
+                        f"copy_file_range stopped at {offset} of {size} bytes"
+                    )
+                offset += copied
+        except OSError:
+            # copy_file_range is not available between all filesystems, resume
+            # with sendfile which still avoids copying through user space
+            while offset < size:
+                sent = os.sendfile(
+                    dst_file.fileno(), src_file.fileno(), offset, size - offset
+                )
+                if sent == 0:
+                    raise OSError(f"sendfile stopped at {offset} of {size} bytes")
+                offset += sent
+
+
 def safe_delete(file_path, is_dir=False):
     if os.path.exists(file_path):
         if is_dir:
@@ -147,7 +208,13 @@ def safe_delete(file_path, is_dir=False):
             os.remove(file_path)
 
 
-def stream_output(command, cwd, stderr=None, env_vars=None):
+def stream_output(command, cwd, stderr=None, env_vars=None, text=True):
+    """
+    Yield (0, None, line) for every stripped line of the command output, lines
+    are bytes when text is False which skips decoding for callers that can
+    consume raw bytes. A non-zero exit code is reported as a last
+    (return_code, stderr, None) entry.
+    """
     if not stderr:
         stderr = tempfile.NamedTemporaryFile()
 
@@ -158,7 +225,8 @@ def stream_output(command, cwd, stderr=None, env_vars=None):
         stdout=subprocess.PIPE,
         stderr=stderr,
         env_vars=env_vars,
-        text=True,
+        text=text,
+        bufsize=STREAM_BUFFER_SIZE,
     ) as invoked_process:
         for line in invoked_process.stdout:
             yield 0, None, line.strip()
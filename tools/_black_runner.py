@@ -0,0 +1,169 @@
+"""Shared driver for the black_check and black_fix tools."""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from multiprocessing import Manager
+from pathlib import Path
+
+import black
+from black.cache import Cache
+from black.const import DEFAULT_INCLUDES
+from black.report import Report
+
+# Directories formatted by black, relative to the workspace root
+SOURCE_ROOTS = ("bsp_server", "tools")
+
+
+def load_config(paths) -> dict:
+    """The [tool.black] settings for paths, parsed once per run."""
+    config_path = black.find_pyproject_toml(tuple(paths))
+    return black.parse_pyproject_toml(config_path) if config_path else {}
+
+
+def load_mode(config) -> black.Mode:
+    """Build the black Mode once per run, it is passed to every worker."""
+    return black.Mode(
+        target_versions={
+            black.TargetVersion[version.upper()]
+            for version in config.get("target_version", ())
+        },
+        line_length=config.get("line_length", black.DEFAULT_LINE_LENGTH),
+        string_normalization=not config.get("skip_string_normalization", False),
+        magic_trailing_comma=not config.get("skip_magic_trailing_comma", False),
+        preview=config.get("preview", False),
+    )
+
+
+def find_sources(paths, config) -> set[Path]:
+    """Discover the files under paths the way black's CLI does.
+
+    The include/exclude/extend_exclude/force_exclude settings of the config
+    are honoured. Without an exclude setting black's default excludes and the
+    .gitignore files apply, so build output, virtualenvs and ignored files
+    are skipped.
+    """
+
+    def pattern(key, default=None):
+        value = config.get(key, default)
+        return black.re_compile_maybe_verbose(value) if value else None
+
+    root, _ = black.find_project_root(tuple(paths))
+    return black.get_sources(
+        root=root,
+        src=tuple(paths),
+        quiet=True,
+        verbose=False,
+        include=pattern("include", DEFAULT_INCLUDES),
+        exclude=pattern("exclude"),
+        extend_exclude=pattern("extend_exclude"),
+        force_exclude=pattern("force_exclude"),
+        report=Report(quiet=True),
+        stdin_filename=None,
+    )
+
+
+def format_source(source, mode, write_back, lock=None):
+    # The AST equivalence recheck is skipped only when writing, black_check
+    # keeps it so that a formatter bug still fails the check.
+    fast = write_back is black.WriteBack.YES
+    try:
+        return black.format_file_in_place(
+            source, fast=fast, mode=mode, write_back=write_back, lock=lock
+        )
+    except Exception as e:
+        return e
+
+
+def format_sources(sources, mode, write_back, lock=None):
+    """Yield (source, changed or exception), formatting files in parallel."""
+    # Same cut-over as black itself, a pool is not worth it for a single file
+    if len(sources) <= 1:
+        for source in sources:
+            yield source, format_source(source, mode, write_back, lock)
+        return
+    max_workers = min(os.cpu_count() or 1, len(sources))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(format_source, source, mode, write_back, lock): source
+            for source in sources
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def run(*, check: bool, paths=SOURCE_ROOTS) -> int:
+    """Check (diff only) or fix formatting of the python files under paths."""
+    action = "Checking" if check else "Fixing"
+    print(f"{action} Python code formatting with black...")
+
+    # bazel run starts us in the runfiles tree, it exports the workspace root
+    workspace_root = os.environ.get("BUILD_WORKSPACE_DIRECTORY")
+    if workspace_root:
+        os.chdir(workspace_root)
+        print(f"Changed to workspace directory: {workspace_root}")
+
+    # Check never writes, diffs are only rendered for someone watching a terminal
+    show_diff = check and sys.stdout.isatty()
+    if show_diff:
+        write_back = black.WriteBack.DIFF
+    elif check:
+        write_back = black.WriteBack.CHECK
+    else:
+        write_back = black.WriteBack.YES
+    config = load_config(paths)
+    mode = load_mode(config)
+    sources = find_sources(paths, config)
+    # black's own cache, files unchanged since they were last seen clean are skipped
+    cache = Cache.read(mode)
+    sources, _ = cache.filtered_cached(sources)
+
+    changed = 0
+    failed = 0
+    clean = []
+    # Diffs are printed by the pool workers, the manager lock keeps them whole.
+    # Zero or one file is formatted inline, without a pool or a manager.
+    use_lock = show_diff and len(sources) > 1
+    with Manager() if use_lock else nullcontext() as manager:
+        lock = manager.Lock() if manager else None
+        for source, result in format_sources(sorted(sources), mode, write_back, lock):
+            if isinstance(result, Exception):
+                print(f"error: cannot format {source}: {result}")
+                failed += 1
+                continue
+            if result:
+                print(f"would reformat {source}" if check else f"reformatted {source}")
+                changed += 1
+                if check:
+                    continue
+            clean.append(source)
+    if clean:
+        cache.write(clean)
+
+    if failed:
+        print(f"Error running black on {failed} file(s)")
+        return 1
+    if check and changed:
+        print(f"{changed} Python file(s) need formatting")
+        print("\nRun 'bazel run //tools:black_fix' to fix formatting")
+        return 1
+    if check:
+        print("All Python files are properly formatted ✓")
+    else:
+        print("Python code formatting applied ✓")
+    return 0
+
+
+def exit_with(code: int) -> None:
+    """Exit, skipping interpreter teardown when the run succeeded.
+
+    The pool and manager are shut down by the time run() returns and nothing
+    else holds resources, so a clean run only needs its output flushed.
+    Failures go through sys.exit so atexit handlers still report.
+    """
+    if code == 0:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+    sys.exit(code)